@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""Offline benchmarks of LinkPlay component on a simulated fleet of devices.
+
+Every simulated speaker answers httpapi.asp commands, UPnP AVTransport
+GetMediaInfo requests and serves its current track with ID3 tag, with
+configurable latency, jitter and failure rate. Run it from the repository
+root with component requirements and Home Assistant installed:
+
+    python3 benchmark.py --devices 1 10 100 --save baseline.json
+    python3 benchmark.py --baseline baseline.json
+
+With --baseline the script exits with status 1 if any metric is worse than
+the baseline by more than --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import socket
+import sys
+import time
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DEVICES = [1, 10, 100]
+DEFAULT_ROUNDS = 10
+DEFAULT_DURATION = 5
+DEFAULT_TOLERANCE = 0.2
+
+TRACK_LENGTH = 240
+TRACK_AUDIO_SIZE = 64 * 1024
+
+DESCRIPTION_XML = """<?xml version="1.0"?>
+<root xmlns="urn:schemas-upnp-org:device-1-0">
+<specVersion><major>1</major><minor>0</minor></specVersion>
+<device>
+<deviceType>urn:schemas-upnp-org:device:MediaRenderer:1</deviceType>
+<friendlyName>{name}</friendlyName>
+<manufacturer>LinkPlay Simulator</manufacturer>
+<modelName>Simulated speaker</modelName>
+<UDN>uuid:{uuid}</UDN>
+<serviceList>
+<service>
+<serviceType>urn:schemas-upnp-org:service:AVTransport:1</serviceType>
+<serviceId>urn:upnp-org:serviceId:AVTransport</serviceId>
+<SCPDURL>/upnp/rendertransportSCPD.xml</SCPDURL>
+<controlURL>/upnp/control/rendertransport1</controlURL>
+<eventSubURL>/upnp/event/rendertransport1</eventSubURL>
+</service>
+</serviceList>
+</device>
+</root>"""
+
+AVTRANSPORT_SCPD_XML = """<?xml version="1.0"?>
+<scpd xmlns="urn:schemas-upnp-org:service-1-0">
+<specVersion><major>1</major><minor>0</minor></specVersion>
+<actionList>
+<action>
+<name>GetMediaInfo</name>
+<argumentList>
+<argument><name>InstanceID</name><direction>in</direction>
+<relatedStateVariable>A_ARG_TYPE_InstanceID</relatedStateVariable></argument>
+<argument><name>CurrentURI</name><direction>out</direction>
+<relatedStateVariable>AVTransportURI</relatedStateVariable></argument>
+<argument><name>CurrentURIMetaData</name><direction>out</direction>
+<relatedStateVariable>AVTransportURIMetaData</relatedStateVariable></argument>
+</argumentList>
+</action>
+</actionList>
+<serviceStateTable>
+<stateVariable sendEvents="no"><name>A_ARG_TYPE_InstanceID</name>
+<dataType>ui4</dataType></stateVariable>
+<stateVariable sendEvents="no"><name>AVTransportURI</name>
+<dataType>string</dataType></stateVariable>
+<stateVariable sendEvents="no"><name>AVTransportURIMetaData</name>
+<dataType>string</dataType></stateVariable>
+</serviceStateTable>
+</scpd>"""
+
+GET_MEDIA_INFO_RESPONSE_XML = """<?xml version="1.0"?>
+<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" \
+s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
+<s:Body>
+<u:GetMediaInfoResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1">
+<CurrentURI>{uri}</CurrentURI>
+<CurrentURIMetaData>{metadata}</CurrentURIMetaData>
+</u:GetMediaInfoResponse>
+</s:Body>
+</s:Envelope>"""
+
+DIDL_LITE_XML = """<DIDL-Lite \
+xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" \
+xmlns:dc="http://purl.org/dc/elements/1.1/" \
+xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/">\
+<item><dc:title>{title}</dc:title><upnp:artist>{artist}</upnp:artist>\
+<upnp:album>{album}</upnp:album></item></DIDL-Lite>"""
+
+
+def _hex(value):
+    """Encode string the way LinkPlay devices do."""
+    return value.encode('utf-8').hex()
+
+
+def _syncsafe(value):
+    """Encode integer as ID3v2 synchsafe integer."""
+    return bytes((value >> shift) & 0x7f for shift in (21, 14, 7, 0))
+
+
+def id3_track(title, artist, album):
+    """Return fake audio file with ID3v2.4 tag."""
+    frames = b''
+    for frame_id, text in (('TIT2', title), ('TPE1', artist),
+                           ('TALB', album)):
+        data = b'\x03' + text.encode('utf-8')
+        frames += frame_id.encode() + _syncsafe(len(data)) + b'\x00\x00' + \
+            data
+    return b'ID3\x04\x00\x00' + _syncsafe(len(frames)) + frames + \
+        b'\xff\xfb\x90\x00' * (TRACK_AUDIO_SIZE // 4)
+
+
+class SimulatedSpeaker:
+    """Fake LinkPlay speaker answering HTTP API and UPnP requests."""
+
+    # pylint: disable=R0913
+    def __init__(self, index, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 radio=False):
+        """Initialize the speaker."""
+        self.name = 'Speaker {0:03d}'.format(index)
+        self.uuid = 'FF31F09E{0:016X}'.format(index)
+        self.requests = 0
+        self.failures = 0
+        self._latency = latency
+        self._jitter = jitter
+        self._failure_rate = failure_rate
+        self._radio = radio
+        self._random = random.Random(index)
+        self._runner = None
+        self._port = None
+        self._status = 'play'
+        self._volume = 30
+        self._muted = 0
+        self._position = 0
+        self._position_at = time.monotonic()
+        self._title = 'Track of {0}'.format(self.name)
+        self._track = id3_track(self._title, 'Simulator', 'Benchmarks')
+
+    @property
+    def host(self):
+        """Host to configure in the component."""
+        return '127.0.0.1:{0}'.format(self._port)
+
+    def url(self, path):
+        """Return URL of the path on the speaker."""
+        return 'http://{0}{1}'.format(self.host, path)
+
+    async def async_start(self):
+        """Start serving requests on a free local port."""
+        app = web.Application()
+        app.router.add_get('/httpapi.asp', self._async_handle_api)
+        app.router.add_get('/description.xml', self._async_handle_description)
+        app.router.add_get('/upnp/rendertransportSCPD.xml',
+                           self._async_handle_scpd)
+        app.router.add_post('/upnp/control/rendertransport1',
+                            self._async_handle_control)
+        app.router.add_get('/track.mp3', self._async_handle_track)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        self._port = sock.getsockname()[1]
+        await web.SockSite(self._runner, sock).start()
+
+    async def async_stop(self):
+        """Stop the speaker."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _async_simulate_network(self, request):
+        """Delay the answer. Return False if connection should fail."""
+        self.requests += 1
+        delay = self._latency + self._random.uniform(-self._jitter,
+                                                     self._jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._random.random() < self._failure_rate:
+            self.failures += 1
+            request.transport.close()
+            return False
+        return True
+
+    def _player_status(self):
+        """Return getPlayerStatus answer."""
+        position = self._position
+        if self._status == 'play':
+            position += time.monotonic() - self._position_at
+        return {
+            'type': '0', 'ch': '0', 'mode': '10', 'loop': '0', 'eq': '0',
+            'status': self._status,
+            'curpos': str(int(position * 1000) % (TRACK_LENGTH * 1000)),
+            'offset_pts': '0',
+            'totlen': '0' if self._radio else str(TRACK_LENGTH * 1000),
+            'Title': _hex(self._title), 'Artist': '', 'Album': '',
+            'alarmflag': '0', 'plicount': '1', 'plicurr': '1',
+            'vol': str(self._volume), 'mute': str(self._muted),
+            'iuri': _hex(self.url('/track.mp3')),
+        }
+
+    def _device_status(self):
+        """Return getStatus answer."""
+        return {
+            'ssid': self.name, 'WifiChannel': '6', 'uuid': self.uuid,
+            'firmware': '4.2.8020', 'hardware': 'A31',
+            'DeviceName': self.name,
+        }
+
+    def _command(self, cmd):
+        """Apply setPlayerCmd command."""
+        args = cmd.split(':')[1:]
+        if args[0] in ('play', 'pause'):
+            self._position += time.monotonic() - self._position_at \
+                if self._status == 'play' else 0
+            self._position_at = time.monotonic()
+            self._status = args[0]
+        elif args[0] == 'vol':
+            self._volume = int(args[1])
+        elif args[0] == 'mute':
+            self._muted = int(args[1])
+        elif args[0] == 'seek':
+            self._position = int(args[1])
+            self._position_at = time.monotonic()
+
+    async def _async_handle_api(self, request):
+        """Answer httpapi.asp command."""
+        if not await self._async_simulate_network(request):
+            return web.Response()
+        cmd = request.query.get('command', '')
+        if cmd == 'getPlayerStatus':
+            return web.Response(text=json.dumps(self._player_status()))
+        if cmd == 'getStatus':
+            return web.Response(text=json.dumps(self._device_status()))
+        if cmd == 'multiroom:getSlaveList':
+            return web.Response(text=json.dumps(
+                {'slaves': '0', 'slave_list': []}))
+        if cmd.startswith('setPlayerCmd:'):
+            self._command(cmd)
+        return web.Response(text='OK')
+
+    async def _async_handle_description(self, request):
+        """Answer UPnP device description."""
+        return web.Response(text=DESCRIPTION_XML.format(
+            name=escape(self.name), uuid=self.uuid), content_type='text/xml')
+
+    async def _async_handle_scpd(self, request):
+        """Answer AVTransport service description."""
+        return web.Response(text=AVTRANSPORT_SCPD_XML,
+                            content_type='text/xml')
+
+    async def _async_handle_control(self, request):
+        """Answer AVTransport GetMediaInfo action."""
+        await request.read()
+        if not await self._async_simulate_network(request):
+            return web.Response()
+        metadata = DIDL_LITE_XML.format(title=escape(self._title),
+                                        artist='Simulator', album='Radio')
+        return web.Response(text=GET_MEDIA_INFO_RESPONSE_XML.format(
+            uri=escape(self.url('/track.mp3')), metadata=escape(metadata)),
+                            content_type='text/xml')
+
+    async def _async_handle_track(self, request):
+        """Serve the track, Range requests are supported."""
+        if not await self._async_simulate_network(request):
+            return web.Response()
+        size = len(self._track)
+        byte_range = request.headers.get('Range', '')
+        if not byte_range.startswith('bytes='):
+            return web.Response(body=self._track)
+        start, _, stop = byte_range[6:].partition('-')
+        if not start:
+            start, stop = size - int(stop), size - 1
+        else:
+            start, stop = int(start), min(int(stop or size - 1), size - 1)
+        return web.Response(
+            status=206, body=self._track[start:stop + 1],
+            headers={'Content-Range': 'bytes {0}-{1}/{2}'.format(
+                start, stop, size)})
+
+
+def percentile(values, percent):
+    """Return percentile of the values."""
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(len(values) - 1,
+                      int(round(percent / 100 * (len(values) - 1))))]
+
+
+async def async_setup_fleet(hass, speakers):
+    """Set up component entities for the speakers."""
+    import upnpclient
+    from custom_components.linkplay import DATA_LINKPLAY, DATA_UPNP
+    from custom_components.linkplay import media_player
+
+    config = media_player.PLATFORM_SCHEMA({
+        'platform': 'linkplay',
+        'hosts': [speaker.host for speaker in speakers],
+    })
+    entities = []
+    await media_player.async_setup_platform(hass, config, entities.extend)
+    registry = hass.data[DATA_LINKPLAY]
+    for index, entity in enumerate(entities):
+        entity.hass = hass
+        entity.entity_id = 'media_player.speaker_{0:03d}'.format(index)
+        registry.async_update(entity)
+
+    # SSDP does not work over loopback, UPnP devices are added directly
+    discovery = hass.data[DATA_UPNP]
+    for speaker in speakers:
+        location = speaker.url('/description.xml')
+        device = await hass.async_add_executor_job(upnpclient.Device,
+                                                   location)
+        discovery.async_add_device(location, device)
+    return entities
+
+
+async def async_bench_update(devices, rounds):
+    """Return latencies of sequential device updates."""
+    timings = []
+    for _ in range(rounds):
+        for device in devices:
+            start = time.perf_counter()
+            await device.async_update()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def async_bench_fleet(devices, duration):
+    """Return number of device updates per second of the whole fleet."""
+    polls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        await asyncio.gather(*[device.async_update() for device in devices])
+        polls += len(devices)
+    return polls / (time.perf_counter() - start)
+
+
+async def async_bench_commands(devices, rounds):
+    """Return round trip times of play and pause commands.
+
+    Commands are sent without the fast polls @user_command schedules after
+    them, as those polls would queue up with the timed commands.
+    """
+    timings = []
+    for index in range(rounds):
+        for device in devices:
+            command = type(device).async_media_pause if index % 2 else \
+                type(device).async_media_play
+            start = time.perf_counter()
+            await command.__wrapped__(device)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def async_stop_hass(hass):
+    """Stop Home Assistant without stopping the event loop.
+
+    HomeAssistant.async_stop() stops the loop when hass was not started by
+    async_run(), so asyncio.run() would fail.
+    """
+    from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+
+    hass.bus.async_fire(EVENT_HOMEASSISTANT_STOP)
+    await hass.async_block_till_done()
+    hass.executor.shutdown()
+
+
+async def async_bench_fleet_size(args, count):
+    """Run all benchmarks for a fleet of count speakers."""
+    from homeassistant.core import HomeAssistant
+
+    speakers = [SimulatedSpeaker(index, args.latency, args.jitter,
+                                 args.failure_rate, args.radio)
+                for index in range(count)]
+    await asyncio.gather(*[speaker.async_start() for speaker in speakers])
+    hass = HomeAssistant()
+    await hass.async_start()
+    devices = []
+    try:
+        devices = await async_setup_fleet(hass, speakers)
+        # Warm up caches and let background metadata lookups finish
+        await async_bench_update(devices, 1)
+        await hass.async_block_till_done()
+
+        updates = await async_bench_update(devices, args.rounds)
+        throughput = await async_bench_fleet(devices, args.duration)
+        commands = await async_bench_commands(devices, args.rounds)
+    finally:
+        for device in devices:
+            await device.async_will_remove_from_hass()
+        # Pooled HTTP connections are closed on stop
+        await async_stop_hass(hass)
+        await asyncio.gather(*[speaker.async_stop() for speaker in speakers])
+
+    return {
+        'update_p50_ms': percentile(updates, 50) * 1000,
+        'update_p95_ms': percentile(updates, 95) * 1000,
+        'fleet_updates_per_s': throughput,
+        'command_p50_ms': percentile(commands, 50) * 1000,
+        'command_p95_ms': percentile(commands, 95) * 1000,
+        'requests': sum(speaker.requests for speaker in speakers),
+        'failures': sum(speaker.failures for speaker in speakers),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return list of regressions against baseline results."""
+    regressions = []
+    for count, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(count, {}).get(metric)
+            if not base or metric in ('requests', 'failures'):
+                continue
+            if metric.endswith('_per_s'):
+                worse = value < base * (1 - tolerance)
+            else:
+                worse = value > base * (1 + tolerance)
+            if worse:
+                regressions.append('{0} devices: {1} {2:.2f} (baseline '
+                                   '{3:.2f})'.format(count, metric, value,
+                                                     base))
+    return regressions
+
+
+def main():
+    """Run benchmarks from command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, nargs='+',
+                        default=DEFAULT_DEVICES,
+                        help='fleet sizes to benchmark')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS,
+                        help='updates and commands per device')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION,
+                        help='seconds of fleet throughput test')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated response latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='simulated latency jitter, seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='share of dropped connections, 0..1')
+    parser.add_argument('--radio', action='store_true',
+                        help='simulate streams without duration, read '
+                             'metadata via UPnP')
+    parser.add_argument('--save', help='save results to JSON file')
+    parser.add_argument('--baseline', help='compare with saved results')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative regression')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {}
+    for count in args.devices:
+        results[str(count)] = metrics = asyncio.run(
+            async_bench_fleet_size(args, count))
+        print('{0:>4} devices: update p50 {1:7.2f} ms, p95 {2:7.2f} ms | '
+              'fleet {3:8.1f} updates/s | command p50 {4:7.2f} ms, '
+              'p95 {5:7.2f} ms'.format(
+                  count, metrics['update_p50_ms'], metrics['update_p95_ms'],
+                  metrics['fleet_updates_per_s'], metrics['command_p50_ms'],
+                  metrics['command_p95_ms']))
+
+    if args.save:
+        with open(args.save, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  args.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,3 +10,9 @@ VERSION = '1.1.6'
 ISSUE_URL = 'https://github.com/Limych/media_player.linkplay/issues'
 
 DATA_LINKPLAY = DOMAIN
+DATA_UPNP = DOMAIN + '_upnp'
+DATA_UPNP_EVENTS = DOMAIN + '_upnp_events'
+DATA_METADATA = DOMAIN + '_metadata'
+DATA_METADATA_WORKERS = DOMAIN + '_metadata_workers'
+DATA_LASTFM = DOMAIN + '_lastfm'
+DATA_HTTP_POOL = DOMAIN + '_http_pool'
@@ -0,0 +1,181 @@
+"""
+Command and request scheduling helpers for LinkPlay based devices.
+
+For more details about this platform, please refer to the documentation at
+https://home-assistant.io/components/media_player.linkplay/
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+COMMAND_MIN_INTERVAL = 0.2
+
+PRIORITY_COMMAND = 0
+PRIORITY_POLL = 1
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+BREAKER_FAILURE_THRESHOLD = 2
+BREAKER_RESET_TIMEOUT = 10
+
+SUPERSEDED = object()
+
+
+class CommandCoalescer:
+    """Latest-wins sender of idempotent commands (volume, mute, seek).
+
+    Every command key has at most one request in flight. Commands queued
+    behind it are replaced by newer ones with the same key, so only the
+    latest value is sent. Requests of the same key are spaced by
+    min_interval seconds.
+    """
+
+    def __init__(self, min_interval=COMMAND_MIN_INTERVAL):
+        """Initialize the coalescer."""
+        self._min_interval = min_interval
+        self._pending = {}
+        self._locks = {}
+        self._next_send = {}
+
+    def is_busy(self, key):
+        """Return True if a command with the key is queued or in flight."""
+        lock = self._locks.get(key)
+        return key in self._pending or (lock is not None and lock.locked())
+
+    async def async_send(self, key, send):
+        """Send command by coroutine function send().
+
+        Return its result or SUPERSEDED if a newer command with the same key
+        was queued before this one was sent.
+        """
+        self._pending[key] = send
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        try:
+            async with self._locks[key]:
+                delay = self._next_send.get(key, 0) - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self._pending.get(key) is not send:
+                    return SUPERSEDED
+                del self._pending[key]
+                self._next_send[key] = time.monotonic() + self._min_interval
+                return await send()
+        finally:
+            # Caller could be cancelled while waiting
+            if self._pending.get(key) is send:
+                del self._pending[key]
+
+
+class RequestScheduler:
+    """Serializer of requests to one device.
+
+    Requests are sent one at a time, commands ahead of polls. A poll which
+    is already queued with the same key is not queued again, its callers
+    share the result.
+    """
+
+    def __init__(self):
+        """Initialize the scheduler."""
+        self._queue = []
+        self._counter = itertools.count()
+        self._polls = {}
+        self._worker = None
+
+    @property
+    def queue_size(self):
+        """Return number of queued requests."""
+        return len(self._queue)
+
+    async def async_request(self, send, priority=PRIORITY_COMMAND, key=None):
+        """Queue request by coroutine function send() and return its result.
+
+        Duplicate polls are detected by key.
+        """
+        if priority == PRIORITY_POLL and key is not None:
+            future = self._polls.get(key)
+            if future is not None:
+                return await asyncio.shield(future)
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._queue,
+                       (priority, next(self._counter), key, future, send))
+        if priority == PRIORITY_POLL and key is not None:
+            self._polls[key] = future
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._async_work())
+        # Request is sent even if caller is cancelled, others may wait for it
+        return await asyncio.shield(future)
+
+    async def _async_work(self):
+        """Send queued requests one by one."""
+        while self._queue:
+            _, _, key, future, send = heapq.heappop(self._queue)
+            if self._polls.get(key) is future:
+                del self._polls[key]
+            try:
+                result = await send()
+            except asyncio.CancelledError:
+                # Not an Exception since Python 3.8. Callers of the request
+                # are cancelled, queued requests are still sent
+                future.cancel()
+            except Exception as exc:  # pylint: disable=W0703
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+
+class CircuitBreaker:
+    """Circuit breaker of requests to one device.
+
+    After failure_threshold failures in a row the circuit opens and requests
+    fail fast. After reset_timeout seconds one probe request is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT):
+        """Initialize the breaker."""
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        """Return state of the circuit."""
+        if self._opened_at is None:
+            return BREAKER_CLOSED
+        if time.monotonic() - self._opened_at >= self._reset_timeout:
+            return BREAKER_HALF_OPEN
+        return BREAKER_OPEN
+
+    @property
+    def available(self):
+        """Return True if the device is considered available."""
+        return self._opened_at is None
+
+    def allow_request(self):
+        """Return True if request can be sent."""
+        return self.state != BREAKER_OPEN
+
+    def record_success(self):
+        """Register successful request. Return True if circuit is closed."""
+        reopened = self._opened_at is not None
+        self._failures = 0
+        self._opened_at = None
+        return reopened
+
+    def record_failure(self):
+        """Register failed request. Return True if circuit is opened."""
+        self._failures += 1
+        if self._opened_at is not None:
+            # Probe failed, wait for the next one
+            self._opened_at = time.monotonic()
+            return False
+        if self._failures >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+            return True
+        return False
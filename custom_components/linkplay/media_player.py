@@ -6,18 +6,16 @@ For more details about this platform, please refer to the documentation at
 https://home-assistant.io/components/media_player.linkplay/
 """
 
+import asyncio
 import binascii
+import ipaddress
 import json
-import upnpclient
-import netdisco.ssdp
 import logging
-import os
-import tempfile
-import urllib.request
-import xml.etree.ElementTree as ET
+import time
+from functools import partial, wraps
 
+import aiohttp
 import homeassistant.helpers.config_validation as cv
-import requests
 import voluptuous as vol
 from homeassistant.components.media_player import (MediaPlayerDevice)
 from homeassistant.components.media_player.const import (
@@ -26,20 +24,48 @@ from homeassistant.components.media_player.const import (
     SUPPORT_SELECT_SOUND_MODE, SUPPORT_SELECT_SOURCE, SUPPORT_SHUFFLE_SET,
     SUPPORT_TURN_OFF, SUPPORT_VOLUME_MUTE, SUPPORT_VOLUME_SET, SUPPORT_STOP)
 from homeassistant.const import (
-    ATTR_ENTITY_ID, CONF_HOST, CONF_NAME, STATE_PAUSED, STATE_PLAYING,
-    STATE_UNKNOWN)
+    ATTR_ENTITY_ID, CONF_HOST, CONF_HOSTS, CONF_NAME, EVENT_HOMEASSISTANT_STOP,
+    STATE_PAUSED, STATE_PLAYING, STATE_UNKNOWN)
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
 from homeassistant.util.dt import utcnow
 
-from . import VERSION, ISSUE_URL, DATA_LINKPLAY
+from . import VERSION, ISSUE_URL, DATA_HTTP_POOL, DATA_LASTFM, \
+    DATA_LINKPLAY, DATA_METADATA, DATA_METADATA_WORKERS, DATA_UPNP, \
+    DATA_UPNP_EVENTS
+from .commands import BREAKER_HALF_OPEN, PRIORITY_COMMAND, PRIORITY_POLL, \
+    SUPERSEDED, CircuitBreaker, CommandCoalescer, RequestScheduler
+from .metadata import STORAGE_KEY, STORAGE_VERSION, LastFMCoverResolver, \
+    MetadataCache, MetadataWorkerPool, async_read_id3_tags, async_read_range
+from .multiroom import MultiroomGroup
+from .recording import TrafficRecorder
+from .registry import DeviceRegistry
+from .stats import RESULT_ERROR, RESULT_OK, RESULT_TIMEOUT, DeviceStats, \
+    command_name, prometheus_text
+from .status import SOUND_MODES, PlayerStatus
+from .upnp import UpnpDiscovery, UpnpEventListener, parse_didl_lite
 
 _LOGGER = logging.getLogger(__name__)
 
 ATTR_MASTER = 'master_id'
 ATTR_PRESET = 'preset'
 ATTR_SLAVES = 'slave_ids'
+ATTR_FORMAT = 'format'
+ATTR_REQUESTS = 'requests'
+ATTR_REQUEST_ERRORS = 'request_errors'
+ATTR_REQUEST_TIMEOUTS = 'request_timeouts'
+ATTR_UPDATE_AVG_MS = 'update_avg_ms'
+ATTR_UPDATE_MAX_MS = 'update_max_ms'
 
 CONF_DEVICE_NAME = 'device_name'
 CONF_LASTFM_API_KEY = 'lastfm_api_key'
+CONF_UPNP_EVENTS = 'upnp_events'
+CONF_PERSIST_METADATA = 'persist_metadata'
+CONF_SUBNET = 'subnet'
+CONF_DIAGNOSTICS = 'diagnostics'
+CONF_RECORD_TRAFFIC = 'record_traffic'
 #
 CONF_DEVICENAME_DEPRECATED = 'devicename'  # TODO: Remove this deprecated key in version 3.0
 
@@ -62,9 +88,34 @@ LINKPLAY_REMOVE_SLAVES_SCHEMA = vol.Schema({
 
 MAX_VOL = 100
 
+# Connections per device and seconds before idle ones are closed. The pool
+# is shared by all platform entries, so it is tuned here, not per entry
+HTTP_POOL_SIZE = 2
+HTTP_POOL_IDLE_TIMEOUT = 60
+
+# Status reads safe to repeat on a dropped keep-alive connection. Other
+# commands could be already executed by the device
+HTTP_RETRY_COMMANDS = ('getStatus', 'getPlayerStatus',
+                       'multiroom:getSlaveList')
+
+# Probing of the largest fleet takes at most
+# ceil(FLEET_MAX_HOSTS / FLEET_PROBE_CONCURRENCY) * FLEET_PROBE_TIMEOUT = 24 s,
+# well below 60 s Home Assistant waits for platform setup
+FLEET_PROBE_TIMEOUT = 3
+FLEET_PROBE_CONCURRENCY = 32
+FLEET_MAX_HOSTS = 256
+
 
 def check_device_name_keys(conf):  # TODO: Remove this check in version 3.0
-    """Ensure CONF_DEVICE_NAME or CONF_DEVICENAME_DEPRECATED are provided."""
+    """Ensure device name is provided for host and not for fleet."""
+    if CONF_HOST not in conf:
+        # Names of fleet devices are read from devices
+        for param in (CONF_NAME, CONF_DEVICE_NAME,
+                      CONF_DEVICENAME_DEPRECATED):
+            if param in conf:
+                raise vol.Invalid('{0} key is not allowed with {1} or '
+                                  '{2}'.format(param, CONF_HOSTS, CONF_SUBNET))
+        return conf
     if sum(param in conf for param in
            [CONF_DEVICE_NAME, CONF_DEVICENAME_DEPRECATED]) != 1:
         raise vol.Invalid(CONF_DEVICE_NAME + ' key not provided')
@@ -74,28 +125,55 @@ def check_device_name_keys(conf):  # TODO: Remove this check in version 3.0
     return conf
 
 
+def subnet(value):
+    """Validate subnet of devices to probe."""
+    try:
+        network = ipaddress.ip_network(value, strict=False)
+    except ValueError as exc:
+        raise vol.Invalid(str(exc))
+    if network.num_addresses > FLEET_MAX_HOSTS:
+        raise vol.Invalid('subnet is too large, at most {0} addresses are '
+                          'allowed'.format(FLEET_MAX_HOSTS))
+    return network
+
+
 PLATFORM_SCHEMA = vol.All(cv.PLATFORM_SCHEMA.extend({
-    vol.Required(CONF_HOST): cv.string,
+    vol.Exclusive(CONF_HOST, 'devices'): cv.string,
+    vol.Exclusive(CONF_HOSTS, 'devices'): vol.All(
+        cv.ensure_list, [cv.string], vol.Length(max=FLEET_MAX_HOSTS)),
+    vol.Exclusive(CONF_SUBNET, 'devices'): subnet,
     vol.Optional(CONF_DEVICE_NAME): cv.string,  # TODO: Mark required in version 3.0
     vol.Optional(CONF_NAME): cv.string,
     vol.Optional(CONF_LASTFM_API_KEY): cv.string,
+    vol.Optional(CONF_UPNP_EVENTS, default=False): cv.boolean,
+    vol.Optional(CONF_PERSIST_METADATA, default=False): cv.boolean,
+    vol.Optional(CONF_DIAGNOSTICS, default=False): cv.boolean,
+    vol.Optional(CONF_RECORD_TRAFFIC): cv.string,
     #
     vol.Optional(CONF_DEVICENAME_DEPRECATED): cv.string
-}), check_device_name_keys)
+}), cv.has_at_least_one_key(CONF_HOST, CONF_HOSTS, CONF_SUBNET),
+                          check_device_name_keys)
 
 SERVICE_CONNECT_MULTIROOM = 'linkplay_connect_multiroom'
 SERVICE_PRESET_BUTTON = 'linkplay_preset_button'
 SERVICE_REMOVE_SLAVES = 'linkplay_remove_slaves'
+SERVICE_DUMP_DIAGNOSTICS = 'linkplay_dump_diagnostics'
+
+DIAGNOSTICS_FORMATS = {'json': 'linkplay_diagnostics.json',
+                       'prometheus': 'linkplay_diagnostics.prom'}
+LINKPLAY_DUMP_DIAGNOSTICS_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_FORMAT, default='json'): vol.In(DIAGNOSTICS_FORMATS)
+})
 
 SERVICE_TO_METHOD = {
     SERVICE_CONNECT_MULTIROOM: {
-        'method': 'connect_multiroom',
+        'method': 'async_connect_multiroom',
         'schema': LINKPLAY_CONNECT_MULTIROOM_SCHEMA},
     SERVICE_PRESET_BUTTON: {
-        'method': 'preset_button',
+        'method': 'async_preset_button',
         'schema': LINKPLAY_PRESET_BUTTON_SCHEMA},
     SERVICE_REMOVE_SLAVES: {
-        'method': 'remove_slaves',
+        'method': 'async_remove_slaves',
         'schema': LINKPLAY_REMOVE_SLAVES_SCHEMA}
 }
 
@@ -105,17 +183,47 @@ SUPPORT_LINKPLAY = \
     SUPPORT_NEXT_TRACK | SUPPORT_PAUSE | SUPPORT_STOP | SUPPORT_PLAY | \
     SUPPORT_TURN_OFF | SUPPORT_PREVIOUS_TRACK | SUPPORT_SEEK | SUPPORT_PLAY_MEDIA
 
-SOUND_MODES = {'0': 'Normal', '1': 'Classic', '2': 'Pop', '3': 'Jazz',
-               '4': 'Vocal'}
 SOURCES = {'wifi': 'WiFi', 'line-in': 'Line-in', 'bluetooth': 'Bluetooth',
            'optical': 'Optical', 'udisk': 'MicroSD'}
-SOURCES_MAP = {'0': 'WiFi', '10': 'WiFi', '31': 'WiFi', '40': 'Line-in',
-               '41': 'Bluetooth', '43': 'Optical'}
-UPNP_TIMEOUT = 5
+UPNP_TRANSPORT_STATES = {'PLAYING': STATE_PLAYING,
+                         'PAUSED_PLAYBACK': STATE_PAUSED,
+                         'STOPPED': STATE_PAUSED}
+UPNP_EVENTS_POLL_INTERVAL = 60
+UPNP_TRACK_VARIABLES = ('CurrentTrackURI', 'CurrentTrackMetaData',
+                        'CurrentTrackDuration')
+
+POLL_INTERVAL_PLAYING = 5
+POLL_INTERVAL_IDLE = 30
+POLL_INTERVAL_COMMAND = 1
+POLL_INTERVAL_OFFLINE_MIN = 10
+POLL_INTERVAL_OFFLINE_MAX = 300
+POLL_FAST_DURATION = 10
+PROBE_TIMEOUT = 1
+POSITION_TOLERANCE = 2
+
+DEVICE_STATUS_TTL = 3600
+DEVICE_STATUS_FIELDS = ('ssid', 'WifiChannel', 'uuid', 'firmware', 'hardware')
+
+TOPOLOGY_TTL = 60
+
+SERVICE_CONCURRENCY = 8
+SERVICE_TIMEOUT = 10
+
+
+def user_command(func):
+    """Poll the device more often for a while after a user command."""
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            self.async_poll_soon()
+    return wrapper
 
 
 # pylint: disable=W0613
-def setup_platform(hass, config, add_entities, discovery_info=None):
+async def async_setup_platform(hass, config, async_add_entities,
+                               discovery_info=None):
     """Set up the LinkPlay device."""
     # Print startup message
     _LOGGER.debug('Version %s', VERSION)
@@ -123,49 +231,210 @@ def setup_platform(hass, config, add_entities, discovery_info=None):
                  'here: %s', ISSUE_URL)
 
     if DATA_LINKPLAY not in hass.data:
-        hass.data[DATA_LINKPLAY] = {}
-
-    def _service_handler(service):
-        """Map services to method of Linkplay devices."""
-        method = SERVICE_TO_METHOD.get(service.service)
-        if not method:
-            return
-
-        params = {key: value for key, value in service.data.items()
-                  if key != ATTR_ENTITY_ID}
-        entity_ids = service.data.get(ATTR_ENTITY_ID)
-        if entity_ids:
-            target_players = [player for player in
-                              hass.data[DATA_LINKPLAY].values()
-                              if player.entity_id in entity_ids]
-        else:
-            target_players = None
-
-        for player in target_players:
-            getattr(player, method['method'])(**params)
-
-    for service in SERVICE_TO_METHOD:
-        schema = SERVICE_TO_METHOD[service]['schema']
-        hass.services.register(
-            DOMAIN, service, _service_handler, schema=schema)
-
-    dev_name = config.get(CONF_DEVICE_NAME,
-                          config.get(CONF_DEVICENAME_DEPRECATED))
-    linkplay = LinkPlayDevice(config.get(CONF_HOST),
-                              dev_name,
-                              config.get(CONF_NAME),
-                              config.get(CONF_LASTFM_API_KEY))
+        hass.data[DATA_LINKPLAY] = DeviceRegistry()
+        hass.data[DATA_UPNP] = UpnpDiscovery(hass)
+        hass.data[DATA_METADATA] = MetadataCache()
+        hass.data[DATA_LASTFM] = LastFMCoverResolver()
+        hass.data[DATA_METADATA_WORKERS] = MetadataWorkerPool(hass)
+        hass.data[DATA_HTTP_POOL] = HttpSessionPool()
+
+        async def async_close_pool(event):
+            """Close pooled HTTP connections on shutdown."""
+            await hass.data[DATA_HTTP_POOL].async_close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close_pool)
+
+        # Services are shared by all devices and registered once
+        async def async_service_handler(service):
+            """Map services to method of Linkplay devices."""
+            method = SERVICE_TO_METHOD.get(service.service)
+            if not method:
+                return
 
-    add_entities([linkplay])
-    hass.data[DATA_LINKPLAY][dev_name] = linkplay
+            params = {key: value for key, value in service.data.items()
+                      if key != ATTR_ENTITY_ID}
+            entity_ids = service.data.get(ATTR_ENTITY_ID)
+            if entity_ids:
+                if isinstance(entity_ids, str):
+                    entity_ids = [entity_ids]
+                registry = hass.data[DATA_LINKPLAY]
+                players = (registry.get_by_entity_id(entity_id)
+                           for entity_id in entity_ids)
+                target_players = [player for player in players
+                                  if player is not None]
+            else:
+                target_players = []
+
+            # Players are called concurrently, each call has its own deadline
+            semaphore = asyncio.Semaphore(SERVICE_CONCURRENCY)
+
+            async def async_call(player):
+                """Call the method of one player."""
+                async with semaphore:
+                    await asyncio.wait_for(
+                        getattr(player, method['method'])(**params),
+                        SERVICE_TIMEOUT)
+
+            results = await asyncio.gather(
+                *[async_call(player) for player in target_players],
+                return_exceptions=True)
+            for player, result in zip(target_players, results):
+                if isinstance(result, asyncio.TimeoutError):
+                    _LOGGER.warning("Service %s for %s timed out",
+                                    service.service, player.entity_id)
+                elif isinstance(result, Exception):
+                    _LOGGER.error("Service %s for %s failed: %r",
+                                  service.service, player.entity_id, result)
+
+        for service in SERVICE_TO_METHOD:
+            schema = SERVICE_TO_METHOD[service]['schema']
+            hass.services.async_register(
+                DOMAIN, service, async_service_handler, schema=schema)
+
+        async def async_dump_diagnostics(service):
+            """Write request statistics of all devices to config dir."""
+            fmt = service.data[ATTR_FORMAT]
+            devices = sorted(hass.data[DATA_LINKPLAY].values(),
+                             key=lambda device: device.entity_id or '')
+            if fmt == 'prometheus':
+                text = prometheus_text((device.entity_id, device.stats)
+                                       for device in devices)
+            else:
+                text = json.dumps({device.entity_id: {
+                    'host': device.host,
+                    'available': device.available,
+                    'requests': device.stats.as_dict(),
+                } for device in devices}, indent=2)
+            path = hass.config.path(DIAGNOSTICS_FORMATS[fmt])
+            await hass.async_add_executor_job(_write_file, path, text)
+            _LOGGER.info("LinkPlay diagnostics written to %s", path)
+
+        hass.services.async_register(
+            DOMAIN, SERVICE_DUMP_DIAGNOSTICS, async_dump_diagnostics,
+            schema=LINKPLAY_DUMP_DIAGNOSTICS_SCHEMA)
+
+    if config[CONF_PERSIST_METADATA] and \
+            not hass.data[DATA_METADATA].persistent:
+        await hass.data[DATA_METADATA].async_load(
+            Store(hass, STORAGE_VERSION, STORAGE_KEY))
+
+    if config[CONF_UPNP_EVENTS] and DATA_UPNP_EVENTS not in hass.data:
+        listener = hass.data[DATA_UPNP_EVENTS] = UpnpEventListener(hass)
+
+        async def async_stop_listener(event):
+            """Cancel event subscriptions on shutdown."""
+            await listener.async_stop()
+
+        await listener.async_start()
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP,
+                                   async_stop_listener)
+
+    traffic = None
+    if CONF_RECORD_TRAFFIC in config:
+        traffic = TrafficRecorder(
+            hass, hass.config.path(config[CONF_RECORD_TRAFFIC]))
+        _LOGGER.info("Recording traffic of LinkPlay devices to %s",
+                     traffic.path)
+
+        async def async_flush_recording(event):
+            """Write the rest of recorded traffic on shutdown."""
+            await traffic.async_flush()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP,
+                                   async_flush_recording)
+
+    http_pool = hass.data[DATA_HTTP_POOL]
+    if CONF_HOST in config:
+        dev_name = config.get(CONF_DEVICE_NAME,
+                              config.get(CONF_DEVICENAME_DEPRECATED))
+        devices = [LinkPlayDevice(config.get(CONF_HOST),
+                                  dev_name,
+                                  config.get(CONF_NAME),
+                                  config.get(CONF_LASTFM_API_KEY),
+                                  config[CONF_UPNP_EVENTS],
+                                  config[CONF_DIAGNOSTICS],
+                                  traffic,
+                                  http_pool)]
+    else:
+        devices = [LinkPlayDevice(host, dev_name,
+                                  lfm_api_key=config.get(CONF_LASTFM_API_KEY),
+                                  upnp_events=config[CONF_UPNP_EVENTS],
+                                  diagnostics=config[CONF_DIAGNOSTICS],
+                                  traffic=traffic, http_pool=http_pool)
+                   for host, dev_name in await async_probe_fleet(http_pool,
+                                                                 config)]
+
+    async_add_entities(devices)
+    for linkplay in devices:
+        hass.data[DATA_LINKPLAY].async_register(linkplay)
+
+
+def _write_file(path, text):
+    """Write text to file. This is a blocking call."""
+    with open(path, 'w') as output:
+        output.write(text)
+
+
+async def async_probe_device(http_pool, host, timeout=FLEET_PROBE_TIMEOUT):
+    """Return getStatus data of LinkPlay device or None if no answer."""
+    resource = "http://{0}/httpapi.asp?command=getStatus".format(host)
+    try:
+        text, _ = await http_pool.request('GET', resource, timeout=timeout)
+        device_status = json.loads(text)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        return None
+    if not isinstance(device_status, dict) or \
+            'DeviceName' not in device_status:
+        return None
+    return device_status
+
+
+async def async_probe_fleet(http_pool, config):
+    """Probe configured hosts concurrently.
+
+    Return list of (host, device name). Hosts of the subnet which do not
+    answer are skipped. Explicitly listed hosts are always returned, named
+    by host if they are offline now.
+    """
+    if CONF_SUBNET in config:
+        hosts = [str(address) for address in config[CONF_SUBNET].hosts()]
+    else:
+        hosts = config[CONF_HOSTS]
+    semaphore = asyncio.Semaphore(FLEET_PROBE_CONCURRENCY)
+
+    async def async_probe(host):
+        """Probe one host."""
+        async with semaphore:
+            return await async_probe_device(http_pool, host)
+
+    results = await asyncio.gather(*[async_probe(host) for host in hosts])
+
+    devices = []
+    for host, device_status in zip(hosts, results):
+        if device_status is not None:
+            devices.append((host, device_status['DeviceName']))
+        elif CONF_HOSTS in config:
+            _LOGGER.warning("LinkPlay device %s is not available", host)
+            devices.append((host, host))
+    _LOGGER.debug("Found %d LinkPlay devices of %d hosts",
+                  len(devices), len(hosts))
+    return devices
 
 
 # pylint: disable=R0902,R0904
 class LinkPlayDevice(MediaPlayerDevice):
     """Representation of a LinkPlay device."""
 
-    def __init__(self, host, devicename, name=None, lfm_api_key=None):
-        """Initialize the LinkPlay device."""
+    # pylint: disable=R0913
+    def __init__(self, host, devicename, name=None, lfm_api_key=None,
+                 upnp_events=False, diagnostics=False, traffic=None,
+                 http_pool=None):
+        """Initialize the LinkPlay device.
+
+        Traffic is TrafficRecorder or TrafficReplay that records or replays
+        all requests of the device. Requests are sent through http_pool,
+        which is not needed for replays.
+        """
         self._devicename = devicename
         if name is not None:
             self._name = name
@@ -185,23 +454,76 @@ class LinkPlayDevice(MediaPlayerDevice):
         self._media_album = None
         self._media_artist = None
         self._media_title = None
-        self._lpapi = LinkPlayRestData(self._host)
+        self._stats = DeviceStats()
+        self._diagnostics = diagnostics
+        self._traffic = traffic
+        if traffic is not None:
+            transport = traffic.transport(self._host, http_pool)
+            self._read_range = traffic.read_range(self._host,
+                                                  async_read_range)
+        else:
+            transport = http_pool
+            self._read_range = async_read_range
+        self._lpapi = LinkPlayRestData(self._host, transport, self._stats)
         self._media_image_url = None
-        self._media_uri = None
-        self._first_update = True
+        self._player_status = None
         if lfm_api_key is not None:
-            self._lfmapi = LastFMRestData(lfm_api_key)
+            self._lfmapi = LastFMRestData(lfm_api_key, transport,
+                                          self._stats)
         else:
             self._lfmapi = None
         self._upnp_device = None
+        self._upnp_metadata = None
+        self._upnp_events = upnp_events
+        self._upnp_subscriptions = []
+        self._upnp_track = {}
+        self._unsub_poll = None
+        self._removed = False
+        self._fast_poll_until = 0
+        self._unreachable_polls = 0
         self._slave_mode = False
         self._slave_ip = None
         self._master = None
         self._wifi_channel = None
         self._ssid = None
-        self._playing_spotify = None
-        self._slave_list = None
-        self._new_song = True
+        self._device_status = {}
+        self._device_status_expires = 0
+        self._multiroom = MultiroomGroup(self)
+        self._commands = CommandCoalescer()
+        self._topology_expires = 0
+        self._written_snapshot = None
+
+    @property
+    def available(self):
+        """Return True if the device (or master of slave) answers."""
+        if self._group_master is not None:
+            return self._group_master.available
+        return self._lpapi.available
+
+    @property
+    def device_state_attributes(self):
+        """Return request statistics if diagnostics are enabled."""
+        if not self._diagnostics:
+            return None
+        requests, errors, timeouts = self._stats.totals()
+        update = self._stats.as_dict().get('update poll', {})
+        return {
+            ATTR_REQUESTS: requests,
+            ATTR_REQUEST_ERRORS: errors,
+            ATTR_REQUEST_TIMEOUTS: timeouts,
+            ATTR_UPDATE_AVG_MS: update.get('avg_ms'),
+            ATTR_UPDATE_MAX_MS: update.get('max_ms'),
+        }
+
+    @property
+    def stats(self):
+        """Request statistics of the device."""
+        return self._stats
+
+    @property
+    def should_poll(self):
+        """Device schedules its own polls, see _async_schedule_poll."""
+        return False
 
     @property
     def name(self):
@@ -211,12 +533,14 @@ class LinkPlayDevice(MediaPlayerDevice):
     @property
     def state(self):
         """Return the state of the device."""
+        if self._group_master is not None:
+            return self._group_master.state
         return self._state
 
     @property
     def volume_level(self):
         """Volume level of the media player (0..1)."""
-        return int(self._volume) / MAX_VOL
+        return self._volume / MAX_VOL
 
     @property
     def is_volume_muted(self):
@@ -226,6 +550,8 @@ class LinkPlayDevice(MediaPlayerDevice):
     @property
     def source(self):
         """Return the current input source."""
+        if self._group_master is not None:
+            return self._group_master.source
         return self._source
 
     @property
@@ -236,6 +562,8 @@ class LinkPlayDevice(MediaPlayerDevice):
     @property
     def sound_mode(self):
         """Return the current sound mode."""
+        if self._group_master is not None:
+            return self._group_master.sound_mode
         return self._sound_mode
 
     @property
@@ -251,31 +579,43 @@ class LinkPlayDevice(MediaPlayerDevice):
     @property
     def media_position(self):
         """Time in seconds of current seek position."""
+        if self._group_master is not None:
+            return self._group_master.media_position
         return self._seek_position
 
     @property
     def media_duration(self):
         """Time in seconds of current song duration."""
+        if self._group_master is not None:
+            return self._group_master.media_duration
         return self._duration
 
     @property
     def media_position_updated_at(self):
         """When the seek position was last updated."""
+        if self._group_master is not None:
+            return self._group_master.media_position_updated_at
         return self._position_updated_at
 
     @property
     def shuffle(self):
         """Return True if shuffle mode is enabled."""
+        if self._group_master is not None:
+            return self._group_master.shuffle
         return self._shuffle
 
     @property
     def media_title(self):
         """Return title of the current track."""
+        if self._group_master is not None:
+            return "Slave mode"
         return self._media_title
 
     @property
     def media_artist(self):
         """Return name of the current track artist."""
+        if self._group_master is not None:
+            return self._group_master.name
         return self._media_artist
 
     @property
@@ -303,6 +643,21 @@ class LinkPlayDevice(MediaPlayerDevice):
         """Wifi channel to use for multiroom configuration."""
         return self._wifi_channel
 
+    @property
+    def device_name(self):
+        """Name of the device as reported in multiroom slave lists."""
+        return self._devicename
+
+    @property
+    def host(self):
+        """Host of the device."""
+        return self._host
+
+    @property
+    def uuid(self):
+        """UUID of the device as reported by getStatus."""
+        return self._device_status.get('uuid')
+
     @property
     def slave_ip(self):
         """Ip used in multiroom configuration."""
@@ -313,135 +668,146 @@ class LinkPlayDevice(MediaPlayerDevice):
         """Device API."""
         return self._lpapi
 
-    def turn_on(self):
+    @property
+    def player_status(self):
+        """Last decoded player status, shared with slaves."""
+        if self._group_master is not None:
+            return self._group_master.player_status
+        return self._player_status
+
+    @property
+    def _group_master(self):
+        """Master device of multiroom group if the device is a slave."""
+        return self._master if self._slave_mode else None
+
+    @property
+    def _media_uri(self):
+        """URI of the current track."""
+        if self._player_status is None:
+            return None
+        return self._player_status.media_uri
+
+    async def async_turn_on(self):
         """Turn the media player on."""
         _LOGGER.warning("This device cannot be turned on remotely.")
 
-    def turn_off(self):
+    @user_command
+    async def async_turn_off(self):
         """Turn off media player."""
-        self._lpapi.call('GET', 'setShutdown:0')
-        value = self._lpapi.data
+        value = await self._lpapi.call('GET', 'setShutdown:0')
         if value != "OK":
             _LOGGER.warning("Failed to power off the device. Got response: %s",
                             value)
 
-    def set_volume_level(self, volume):
+    @user_command
+    async def async_set_volume_level(self, volume):
         """Set volume level, range 0..1."""
-        volume = str(round(volume * MAX_VOL))
+        volume = round(volume * MAX_VOL)
+        # Show new volume at once, e.g. while volume slider is dragged
+        self._volume = volume
+        self.async_schedule_update_ha_state()
         if not self._slave_mode:
-            self._lpapi.call('GET', 'setPlayerCmd:vol:{0}'.format(str(volume)))
-            value = self._lpapi.data
-            if value == "OK":
-                self._volume = volume
-            else:
-                _LOGGER.warning("Failed to set volume. Got response: %s",
-                                value)
+            send = partial(self._lpapi.call, 'GET',
+                           'setPlayerCmd:vol:{0}'.format(volume))
         else:
-            self._master.lpapi.call('GET',
-                                    'multiroom:SlaveVolume:{0}:{1}'.format(
-                                        self._slave_ip, str(volume)))
-            value = self._master.lpapi.data
-            if value == "OK":
-                self._volume = volume
-            else:
-                _LOGGER.warning("Failed to set volume. Got response: %s",
-                                value)
-
-    def mute_volume(self, mute):
+            send = partial(self._master.lpapi.call, 'GET',
+                           'multiroom:SlaveVolume:{0}:{1}'.format(
+                               self._slave_ip, volume))
+        value = await self._commands.async_send('vol', send)
+        if value not in ("OK", SUPERSEDED):
+            _LOGGER.warning("Failed to set volume. Got response: %s", value)
+
+    @user_command
+    async def async_mute_volume(self, mute):
         """Mute (true) or unmute (false) media player."""
+        self._muted = mute
+        self.async_schedule_update_ha_state()
         if not self._slave_mode:
-            self._lpapi.call('GET',
-                             'setPlayerCmd:mute:{0}'.format(str(int(mute))))
-            value = self._lpapi.data
-            if value == "OK":
-                self._muted = mute
-            else:
-                _LOGGER.warning("Failed mute/unmute volume. Got response: %s",
-                                value)
+            send = partial(self._lpapi.call, 'GET',
+                           'setPlayerCmd:mute:{0}'.format(int(mute)))
         else:
-            self._master.lpapi.call('GET',
-                                    'multiroom:SlaveMute:{0}:{1}'.format(
-                                        self._slave_ip, str(int(mute))))
-            value = self._master.lpapi.data
-            if value == "OK":
-                self._muted = mute
-            else:
-                _LOGGER.warning("Failed mute/unmute volume. Got response: %s",
-                                value)
+            send = partial(self._master.lpapi.call, 'GET',
+                           'multiroom:SlaveMute:{0}:{1}'.format(
+                               self._slave_ip, int(mute)))
+        value = await self._commands.async_send('mute', send)
+        if value not in ("OK", SUPERSEDED):
+            _LOGGER.warning("Failed mute/unmute volume. Got response: %s",
+                            value)
 
-    def media_play(self):
+    @user_command
+    async def async_media_play(self):
         """Send play command."""
         if not self._slave_mode:
-            self._lpapi.call('GET', 'setPlayerCmd:play')
-            value = self._lpapi.data
+            value = await self._lpapi.call('GET', 'setPlayerCmd:play')
             if value == "OK":
                 self._state = STATE_PLAYING
-                for slave in self._slave_list:
-                    slave.set_state(STATE_PLAYING)
             else:
                 _LOGGER.warning("Failed to start playback. Got response: %s",
                                 value)
         else:
-            self._master.media_play()
+            await self._master.async_media_play()
 
-    def media_pause(self):
+    @user_command
+    async def async_media_pause(self):
         """Send pause command."""
         if not self._slave_mode:
-            self._lpapi.call('GET', 'setPlayerCmd:pause')
-            value = self._lpapi.data
+            value = await self._lpapi.call('GET', 'setPlayerCmd:pause')
             if value == "OK":
                 self._state = STATE_PAUSED
-                for slave in self._slave_list:
-                    slave.set_state(STATE_PAUSED)
             else:
                 _LOGGER.warning("Failed to pause playback. Got response: %s",
                                 value)
         else:
-            self._master.media_pause()
+            await self._master.async_media_pause()
 
-    def media_stop(self):
+    async def async_media_stop(self):
         """Send stop command."""
-        self.media_pause()
+        await self.async_media_pause()
 
-    def media_next_track(self):
+    @user_command
+    async def async_media_next_track(self):
         """Send next track command."""
         if not self._slave_mode:
-            self._lpapi.call('GET', 'setPlayerCmd:next')
-            value = self._lpapi.data
+            value = await self._lpapi.call('GET', 'setPlayerCmd:next')
             if value != "OK":
                 _LOGGER.warning("Failed skip to next track. Got response: %s",
                                 value)
         else:
-            self._master.media_next_track()
+            await self._master.async_media_next_track()
 
-    def media_previous_track(self):
+    @user_command
+    async def async_media_previous_track(self):
         """Send previous track command."""
         if not self._slave_mode:
-            self._lpapi.call('GET', 'setPlayerCmd:prev')
-            value = self._lpapi.data
+            value = await self._lpapi.call('GET', 'setPlayerCmd:prev')
             if value != "OK":
                 _LOGGER.warning("Failed to skip to previous track."
                                 " Got response: %s", value)
         else:
-            self._master.media_previous_track()
+            await self._master.async_media_previous_track()
 
-    def media_seek(self, position):
+    @user_command
+    async def async_media_seek(self, position):
         """Send media_seek command to media player."""
         if not self._slave_mode:
-            self._lpapi.call('GET',
-                             'setPlayerCmd:seek:{0}'.format(str(position)))
-            value = self._lpapi.data
-            if value != "OK":
+            self._seek_position = int(position)
+            self._position_updated_at = utcnow()
+            self.async_schedule_update_ha_state()
+            value = await self._commands.async_send('seek', partial(
+                self._lpapi.call, 'GET',
+                'setPlayerCmd:seek:{0}'.format(str(position))))
+            if value not in ("OK", SUPERSEDED):
                 _LOGGER.warning("Failed to seek. Got response: %s",
                                 value)
         else:
-            self._master.media_seek(position)
+            await self._master.async_media_seek(position)
 
-    def clear_playlist(self):
+    async def async_clear_playlist(self):
         """Clear players playlist."""
         pass
 
-    def play_media(self, media_type, media_id, **kwargs):
+    @user_command
+    async def async_play_media(self, media_type, media_id, **kwargs):
         """Play media from a URL or file."""
         if not self._slave_mode:
             if not media_type == MEDIA_TYPE_MUSIC:
@@ -449,107 +815,117 @@ class LinkPlayDevice(MediaPlayerDevice):
                     "Invalid media type %s. Only %s is supported",
                     media_type, MEDIA_TYPE_MUSIC)
                 return
-            self._lpapi.call('GET', 'setPlayerCmd:play:{0}'.format(media_id))
-            value = self._lpapi.data
+            value = await self._lpapi.call(
+                'GET', 'setPlayerCmd:play:{0}'.format(media_id))
             if value != "OK":
                 _LOGGER.warning("Failed to play media. Got response: %s",
                                 value)
         else:
-            self._master.play_media(media_type, media_id)
+            await self._master.async_play_media(media_type, media_id)
 
-    def select_source(self, source):
+    @user_command
+    async def async_select_source(self, source):
         """Select input source."""
         if not self._slave_mode:
             if source == 'MicroSD':
                 temp_source = 'udisk'
             else:
                 temp_source = source.lower()
-            self._lpapi.call('GET',
-                             'setPlayerCmd:switchmode:{0}'.format(temp_source))
-            value = self._lpapi.data
+            value = await self._lpapi.call(
+                'GET', 'setPlayerCmd:switchmode:{0}'.format(temp_source))
+            self.invalidate_topology()
             if value == "OK":
                 self._source = source
-                for slave in self._slave_list:
-                    slave.set_source(source)
             else:
                 _LOGGER.warning("Failed to select source. Got response: %s",
                                 value)
         else:
-            self._master.select_source(source)
+            await self._master.async_select_source(source)
 
-    def select_sound_mode(self, sound_mode):
+    @user_command
+    async def async_select_sound_mode(self, sound_mode):
         """Set Sound Mode for device."""
         if not self._slave_mode:
             mode = list(SOUND_MODES.keys())[list(
                 SOUND_MODES.values()).index(sound_mode)]
-            self._lpapi.call('GET', 'setPlayerCmd:equalizer:{0}'.format(mode))
-            value = self._lpapi.data
+            value = await self._lpapi.call(
+                'GET', 'setPlayerCmd:equalizer:{0}'.format(mode))
             if value == "OK":
                 self._sound_mode = sound_mode
-                for slave in self._slave_list:
-                    slave.set_sound_mode(sound_mode)
             else:
                 _LOGGER.warning("Failed to set sound mode. Got response: %s",
                                 value)
         else:
-            self._master.select_sound_mode(sound_mode)
+            await self._master.async_select_sound_mode(sound_mode)
 
-    def set_shuffle(self, shuffle):
+    @user_command
+    async def async_set_shuffle(self, shuffle):
         """Change the shuffle mode."""
         if not self._slave_mode:
             mode = '2' if shuffle else '0'
-            self._lpapi.call('GET', 'setPlayerCmd:loopmode:{0}'.format(mode))
-            value = self._lpapi.data
+            value = await self._lpapi.call(
+                'GET', 'setPlayerCmd:loopmode:{0}'.format(mode))
             if value != "OK":
                 _LOGGER.warning("Failed to change shuffle mode. "
                                 "Got response: %s", value)
         else:
-            self._master.set_shuffle(shuffle)
+            await self._master.async_set_shuffle(shuffle)
 
-    def preset_button(self, preset):
+    @user_command
+    async def async_preset_button(self, preset):
         """Simulate pressing a physical preset button."""
         if not self._slave_mode:
-            self._lpapi.call('GET',
-                             'IOSimuKeyIn:{0}'.format(str(preset).zfill(3)))
-            value = self._lpapi.data
+            value = await self._lpapi.call(
+                'GET', 'IOSimuKeyIn:{0}'.format(str(preset).zfill(3)))
             if value != "OK":
                 _LOGGER.warning("Failed to press preset button %s. "
                                 "Got response: %s", preset, value)
         else:
-            self._master.preset_button(preset)
+            await self._master.async_preset_button(preset)
 
-    def connect_multiroom(self, master_id):
+    @user_command
+    async def async_connect_multiroom(self, master_id):
         """Add selected slaves to multiroom configuration."""
-        for device in self.hass.data[DATA_LINKPLAY].values():
-            if device.entity_id == master_id:
-                cmd = "ConnectMasterAp:ssid={0}:ch={1}:auth=OPEN:".format(
-                    device.ssid, device.wifi_channel) + \
-                      "encry=NONE:pwd=:chext=0"
-                self._lpapi.call('GET', cmd)
-                value = self._lpapi.data
-                if value == "OK":
-                    self._slave_mode = True
-                    self._master = device
-                else:
-                    _LOGGER.warning("Failed to connect multiroom. "
-                                    "Got response: %s", value)
-
-    def remove_slaves(self, slave_ids):
+        device = self.hass.data[DATA_LINKPLAY].get_by_entity_id(master_id)
+        if device is None:
+            _LOGGER.warning("Unknown multiroom master %s", master_id)
+            return
+
+        cmd = "ConnectMasterAp:ssid={0}:ch={1}:auth=OPEN:".format(
+            device.ssid, device.wifi_channel) + "encry=NONE:pwd=:chext=0"
+        value = await self._lpapi.call('GET', cmd)
+        self.invalidate_device_status()
+        device.invalidate_topology()
+        device.async_poll_soon()
+        if value == "OK":
+            self._slave_mode = True
+            self._master = device
+        else:
+            _LOGGER.warning("Failed to connect multiroom. "
+                            "Got response: %s", value)
+
+    @user_command
+    async def async_remove_slaves(self, slave_ids):
         """Remove selected slaves from multiroom configuration."""
+        registry = self.hass.data[DATA_LINKPLAY]
         for slave_id in slave_ids:
-            for device in self.hass.data[DATA_LINKPLAY].values():
-                if device.entity_id == slave_id:
-                    self._lpapi.call('GET',
-                                     'multiroom:SlaveKickout:{0}'.format(
-                                         device.slave_ip))
-                    value = self._lpapi.data
-                    if value == "OK":
-                        device.set_slave_mode(False)
-                        device.set_slave_ip(None)
-                        device.set_master(None)
-                    else:
-                        _LOGGER.warning("Failed to remove slave %s. "
-                                        "Got response: %s", slave_id, value)
+            device = registry.get_by_entity_id(slave_id)
+            if device is None:
+                _LOGGER.warning("Unknown multiroom slave %s", slave_id)
+                continue
+
+            value = await self._lpapi.call(
+                'GET', 'multiroom:SlaveKickout:{0}'.format(device.slave_ip))
+            self.invalidate_device_status()
+            self.invalidate_topology()
+            device.invalidate_device_status()
+            if value == "OK":
+                device.set_slave_mode(False)
+                device.set_slave_ip(None)
+                device.set_master(None)
+            else:
+                _LOGGER.warning("Failed to remove slave %s. "
+                                "Got response: %s", slave_id, value)
 
     def set_master(self, master):
         """Set master device for multiroom configuration."""
@@ -559,326 +935,615 @@ class LinkPlayDevice(MediaPlayerDevice):
         """Set current device as slave in a multiroom configuration."""
         self._slave_mode = slave_mode
 
-    def set_media_title(self, title):
-        """Set the media title property."""
-        self._media_title = title
-
-    def set_media_artist(self, artist):
-        """Set the media artist property."""
-        self._media_artist = artist
-
-    def set_volume(self, volume):
-        """Set the volume property."""
-        self._volume = volume
-
-    def set_muted(self, mute):
-        """Set the muted property."""
-        self._muted = mute
-
-    def set_state(self, state):
-        """Set the state property."""
-        self._state = state
-
     def set_slave_ip(self, slave_ip):
         """Set the slave ip property."""
         self._slave_ip = slave_ip
 
-    def set_seek_position(self, position):
-        """Set the seek position property."""
-        self._seek_position = position
-
-    def set_duration(self, duration):
-        """Set the duration property."""
-        self._duration = duration
-
-    def set_position_updated_at(self, time):
-        """Set the position updated at property."""
-        self._position_updated_at = time
-
-    def set_source(self, source):
-        """Set the source property."""
-        self._source = source
+    def join_group(self, master, slave_ip, volume, muted):
+        """Set current device as slave of master.
+
+        Return True if any slave property has changed.
+        """
+        overlay = (master, slave_ip, int(volume), bool(int(muted)))
+        changed = not self._slave_mode or overlay != (
+            self._master, self._slave_ip, self._volume, self._muted)
+        self._slave_mode = True
+        self._master, self._slave_ip, self._volume, self._muted = overlay
+        return changed
+
+    def leave_group(self, master):
+        """Release current device from multiroom group of master.
+
+        Return False if the device is not a slave of the master.
+        """
+        if not self._slave_mode or self._master is not master:
+            return False
+        self.set_slave_mode(False)
+        self.set_master(None)
+        self.set_slave_ip(None)
+        return True
 
-    def set_sound_mode(self, mode):
-        """Set the sound mode property."""
-        self._sound_mode = mode
+    def playback_snapshot(self):
+        """Return snapshot of playback state shared with slaves."""
+        return (self.available, self.state, self.source, self.sound_mode,
+                self.shuffle, self.media_position,
+                self.media_position_updated_at, self.media_duration,
+                self.name)
 
     def _is_playing_new_track(self, status):
         """Check if track is changed since last update."""
-        if int(int(status['totlen']) / 1000) != self._duration:
+        if status.duration != self._duration:
             return True
-        if status['totlen'] == '0':
+        if status.playing_stream:
             # Special case when listening to radio
-            try:
-                return bool(bytes.fromhex(
-                    status['Title']).decode('utf-8') != self._media_title)
-            except ValueError:
-                return True
+            title = status.media_title
+            return title is None or title != self._media_title
         return False
 
-    def _update_via_upnp(self):
-        """Update track info via UPNP."""
+    @callback
+    def _async_lookup_metadata(self, job, *args):
+        """Run metadata lookup job in background, off the poll path."""
+        self.hass.data[DATA_METADATA_WORKERS].async_submit(self, job, *args)
+
+    def _set_upnp_metadata(self, metadata):
+        """Apply DIDL-Lite track metadata. Return False if it is unchanged.
+
+        Parsed result is reused while the raw metadata string is the same.
+        """
         import validators
 
-        self._media_title = None
-        self._media_album = None
-        self._media_image_url = None
+        if metadata == self._upnp_metadata:
+            return False
+        self._upnp_metadata = metadata
 
-        if self._upnp_device is None:
-            return
+        if metadata is None:
+            self._media_title = None
+            self._media_artist = None
+            self._media_album = None
+            self._media_image_url = None
+            return True
 
-        media_info = self._upnp_device.AVTransport.GetMediaInfo(InstanceID=0)
-        media_info = media_info.get('CurrentURIMetaData')
+        self._media_title, self._media_artist, self._media_album, \
+            self._media_image_url = parse_didl_lite(metadata)
+        if self._media_image_url is not None and \
+                not validators.url(self._media_image_url):
+            self._media_image_url = None
+        return True
 
-        if media_info is None:
+    async def _async_update_via_upnp(self):
+        """Update track info via UPNP."""
+        media_info = None
+        if self._upnp_device is not None:
+            start = time.monotonic()
+            result = RESULT_ERROR
+            try:
+                media_info = await self.hass.async_add_executor_job(
+                    partial(self._upnp_device.AVTransport.GetMediaInfo,
+                            InstanceID=0))
+                result = RESULT_OK
+            finally:
+                self._stats.record('upnp', 'GetMediaInfo',
+                                   time.monotonic() - start, result)
+            media_info = media_info.get('CurrentURIMetaData')
+
+        if self._set_upnp_metadata(media_info):
+            self.async_schedule_update_ha_state()
+
+    async def _async_subscribe_upnp_events(self):
+        """Subscribe to AVTransport and RenderingControl events."""
+        listener = self.hass.data[DATA_UPNP_EVENTS]
+        for name in ('AVTransport', 'RenderingControl'):
+            service = self._upnp_device.service_map.get(name)
+            if service is not None:
+                self._upnp_subscriptions.append(
+                    await listener.async_subscribe(
+                        service, self._host, self._async_on_upnp_event))
+
+    async def _async_resubscribe_upnp_events(self):
+        """Renew event subscriptions after the device was unreachable."""
+        _LOGGER.debug("Resubscribing to UPnP events of %s", self._host)
+        await asyncio.gather(*[subscription.async_resubscribe()
+                               for subscription in self._upnp_subscriptions])
+
+    @callback
+    def _async_on_upnp_event(self, changes):
+        """Apply state changes pushed by the device.
+
+        Streams take metadata of the URI, like GetMediaInfo on polls. Other
+        sources are polled soon when the device reports another track.
+        """
+        if 'TransportState' in changes:
+            self._state = UPNP_TRANSPORT_STATES.get(
+                changes['TransportState'], self._state)
+        # Values of commands being sent are not reverted by echoed events
+        if 'Volume' in changes and not self._commands.is_busy('vol'):
+            self._volume = int(changes['Volume'])
+        if 'Mute' in changes and not self._commands.is_busy('mute'):
+            self._muted = bool(int(changes['Mute']))
+
+        track = {name: changes[name] for name in UPNP_TRACK_VARIABLES
+                 if name in changes}
+        new_track = any(self._upnp_track.get(name) != value
+                        for name, value in track.items())
+        self._upnp_track.update(track)
+
+        if self._player_status is not None and \
+                (self._player_status.playing_spotify or
+                 self._player_status.playing_stream):
+            metadata = changes.get('AVTransportURIMetaData')
+            if metadata:
+                self._set_upnp_metadata(metadata)
+        elif new_track:
+            self.async_poll_soon()
+
+        self.async_write_state_if_changed()
+
+    def _poll_interval(self):
+        """Return delay before next poll depending on device activity."""
+        if self._unreachable_polls:
+            return min(POLL_INTERVAL_OFFLINE_MIN *
+                       2 ** (self._unreachable_polls - 1),
+                       POLL_INTERVAL_OFFLINE_MAX)
+        if time.monotonic() < self._fast_poll_until:
+            return POLL_INTERVAL_COMMAND
+        if self._upnp_subscriptions and \
+                all(sub.active for sub in self._upnp_subscriptions):
+            return UPNP_EVENTS_POLL_INTERVAL
+        if self._state == STATE_PLAYING and not self._slave_mode:
+            return POLL_INTERVAL_PLAYING
+        return POLL_INTERVAL_IDLE
+
+    @callback
+    def _async_schedule_poll(self, delay=None):
+        """Schedule next poll of the device."""
+        if self._removed:
+            return
+        if self._unsub_poll is not None:
+            self._unsub_poll()
+        if delay is None:
+            delay = self._poll_interval()
+        self._unsub_poll = async_call_later(self.hass, delay, self._async_poll)
+
+    async def _async_poll(self, now=None):
+        """Poll the device and schedule next poll.
+
+        State is written to Home Assistant only if something has changed.
+        """
+        self._unsub_poll = None
+        interval = self._poll_interval()
+        start = time.monotonic()
+        result = RESULT_OK
+        try:
+            await self.async_device_update()
+        except Exception:  # pylint: disable=W0703
+            result = RESULT_ERROR
+            _LOGGER.exception("Update for %s fails", self.entity_id)
+        finally:
+            duration = time.monotonic() - start
+            self._stats.record('update', 'poll', duration, result)
+            if duration > interval:
+                _LOGGER.warning("Update of %s took %.1f s, longer than poll "
+                                "interval of %d s", self.entity_id, duration,
+                                interval)
+            if self._unsub_poll is None:
+                self._async_schedule_poll()
+        if not self._removed:
+            self.async_write_state_if_changed()
+
+    def state_snapshot(self):
+        """Return compact snapshot of the state shown in Home Assistant."""
+        return self.playback_snapshot() + (
+            self._volume, self._muted, self.media_title, self.media_artist,
+            self._media_album, self._media_image_url)
+
+    @callback
+    def async_write_state_if_changed(self):
+        """Write state if it differs from the one last written."""
+        if self.state_snapshot() != self._written_snapshot:
+            self.async_schedule_update_ha_state()
+
+    async def async_update_ha_state(self, force_refresh=False):
+        """Write state to Home Assistant and remember what was written."""
+        await super().async_update_ha_state(force_refresh)
+        self._written_snapshot = self.state_snapshot()
+
+    def _update_position(self, position, state):
+        """Update seek position.
+
+        Timestamp is refreshed only when the position differs from the one
+        Home Assistant extrapolates from the previous update.
+        """
+        now = utcnow()
+        if state == self._state and self._position_updated_at is not None:
+            expected = self._seek_position
+            if state == STATE_PLAYING:
+                expected += (now - self._position_updated_at).total_seconds()
+            if abs(position - expected) < POSITION_TOLERANCE:
+                return
+        self._seek_position = position
+        self._position_updated_at = now
+
+    @callback
+    def async_poll_soon(self):
+        """Switch to fast polling to pick up results of a user command."""
+        self._fast_poll_until = time.monotonic() + POLL_FAST_DURATION
+        self._async_schedule_poll(POLL_INTERVAL_COMMAND)
+
+    async def async_added_to_hass(self):
+        """Index the device by entity ID and start polling it."""
+        self.hass.data[DATA_LINKPLAY].async_update(self)
+        self._removed = False
+        self._async_schedule_poll(0)
+
+    async def async_will_remove_from_hass(self):
+        """Stop polling and cancel event subscriptions.
+
+        Polls running at the moment and user commands do not reschedule
+        polling of the removed device.
+        """
+        self._removed = True
+        self.hass.data[DATA_LINKPLAY].async_unregister(self)
+        if self._unsub_poll is not None:
+            self._unsub_poll()
+            self._unsub_poll = None
+        self.hass.data[DATA_METADATA_WORKERS].async_cancel(self)
+        for subscription in self._upnp_subscriptions:
+            await subscription.async_unsubscribe()
+        self._upnp_subscriptions = []
+
+    def invalidate_device_status(self):
+        """Force refresh of cached getStatus data on next update."""
+        self._device_status_expires = 0
+
+    def invalidate_topology(self):
+        """Force refresh of cached multiroom slave list on next update."""
+        self._topology_expires = 0
+
+    async def _async_update_topology(self):
+        """Refresh multiroom slaves of the device, cached for TOPOLOGY_TTL."""
+        if time.monotonic() < self._topology_expires:
             return
 
-        xml_tree = ET.fromstring(media_info)
+        slave_list = await self._lpapi.call('GET', 'multiroom:getSlaveList',
+                                            priority=PRIORITY_POLL)
 
-        xml_path = "{urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/}item/"
-        title_xml_path = "{http://purl.org/dc/elements/1.1/}title"
-        artist_xml_path = "{urn:schemas-upnp-org:metadata-1-0/upnp/}artist"
-        album_xml_path = "{urn:schemas-upnp-org:metadata-1-0/upnp/}album"
-        image_xml_path = "{urn:schemas-upnp-org:metadata-1-0/upnp/}albumArtURI"
+        try:
+            slave_list = json.loads(slave_list)
+        except (TypeError, ValueError):
+            _LOGGER.warning("REST result could not be parsed as JSON")
+            _LOGGER.debug("Erroneous JSON: %s", slave_list)
+            slave_list = None
 
-        self._media_title = \
-            xml_tree.find("{0}{1}".format(xml_path, title_xml_path)).text
-        self._media_artist = \
-            xml_tree.find("{0}{1}".format(xml_path, artist_xml_path)).text
-        self._media_album = \
-            xml_tree.find("{0}{1}".format(xml_path, album_xml_path)).text
-        self._media_image_url = \
-            xml_tree.find("{0}{1}".format(xml_path, image_xml_path)).text
+        members = []
+        if isinstance(slave_list, dict):
+            self._topology_expires = time.monotonic() + TOPOLOGY_TTL
+            if int(slave_list['slaves']) > 0:
+                for slave in slave_list['slave_list']:
+                    device = self.hass.data[DATA_LINKPLAY].find(
+                        uuid=slave.get('uuid'), host=slave.get('ip'),
+                        name=slave.get('name'))
+                    if device:
+                        members.append((device, slave))
+            self._multiroom.async_set_members(members)
+        else:
+            _LOGGER.warning("JSON result was not a dictionary")
 
-        if not validators.url(self._media_image_url):
-            self._media_image_url = None
+    async def _async_update_device_status(self):
+        """Refresh static device info, cached for DEVICE_STATUS_TTL.
 
-    def _update_from_id3(self):
-        """Update track info with eyed3."""
-        import eyed3
-        from urllib.error import URLError
-        try:
-            filename, _ = urllib.request.urlretrieve(self._media_uri)
-            audiofile = eyed3.load(filename)
-            self._media_title = audiofile.tag.title
-            self._media_artist = audiofile.tag.artist
-            self._media_album = audiofile.tag.album
-            # Remove tempfile when done
-            if filename.startswith(tempfile.gettempdir()):
-                os.remove(filename)
-
-        except (URLError, ValueError):
-            self._media_title = None
-            self._media_artist = None
-            self._media_album = None
+        Return False if the device did not answer.
+        """
+        if time.monotonic() < self._device_status_expires:
+            return True
+
+        device_api_result = await self._lpapi.call('GET', 'getStatus',
+                                                   priority=PRIORITY_POLL)
+        if device_api_result is None:
+            return False
 
-    def _get_lastfm_coverart(self):
-        """Get cover art from last.fm."""
-        self._lfmapi.call('GET',
-                          'track.getInfo',
-                          "artist={0}&track={1}".format(
-                              self._media_artist,
-                              self._media_title))
-        lfmdata = json.loads(self._lfmapi.data)
         try:
-            self._media_image_url = \
-                lfmdata['track']['album']['image'][2]['#text']
-        except (ValueError, KeyError):
-            self._media_image_url = None
+            device_status = json.loads(device_api_result)
+        except ValueError:
+            _LOGGER.warning("REST result could not be parsed as JSON")
+            _LOGGER.debug("Erroneous JSON: %s", device_api_result)
+            device_status = None
+
+        if isinstance(device_status, dict):
+            uuid = self.uuid
+            self._device_status = {key: device_status.get(key)
+                                   for key in DEVICE_STATUS_FIELDS}
+            if self.uuid != uuid:
+                self.hass.data[DATA_LINKPLAY].async_update(self)
+            self._device_status_expires = \
+                time.monotonic() + DEVICE_STATUS_TTL
+            self._wifi_channel = device_status['WifiChannel']
+            self._ssid = \
+                binascii.hexlify(device_status['ssid'].encode('utf-8'))
+            self._ssid = self._ssid.decode()
+        return True
 
-    def upnp_discover(self, timeout=5):
-        devices = {}
-        for entry in netdisco.ssdp.scan(timeout):
-            if entry.location in devices:
-                continue
-            try:
-                devices[entry.location] = upnpclient.Device(entry.location)
-            except Exception as exc:
-                _LOGGER.debug('Error \'%s\' for %s', exc, entry.location)
-        return list(devices.values())
+    async def _async_update_track_info(self, media_uri):
+        """Update track info from ID3 tags and last.fm, cached by URI.
+
+        Track info and cover art are published as soon as each is known.
+        """
+        cache = self.hass.data[DATA_METADATA]
+        info = cache.get(media_uri)
+        if info is None:
+            info = await async_read_id3_tags(
+                async_get_clientsession(self.hass), media_uri,
+                self._read_range) + (None,)
+            if info[0] is not None:
+                cache.set(media_uri, info)
+        if media_uri != self._media_uri:
+            return
+
+        self._media_title, self._media_artist, self._media_album, \
+            self._media_image_url = info
+        self.async_schedule_update_ha_state()
+
+        if self._lfmapi is None or self._media_title is None or \
+                self._media_image_url is not None:
+            return
+
+        image_url = await self.hass.data[DATA_LASTFM].async_get_cover(
+            self._lfmapi, self._media_artist, self._media_title)
+        if media_uri != self._media_uri or image_url is None:
+            return
+
+        self._media_image_url = image_url
+        cache.set(media_uri, info[:3] + (image_url,))
+        self.async_schedule_update_ha_state()
 
     # pylint: disable=R0912,R0915
-    def update(self):
+    async def async_update(self):
         """Get the latest player details from the device."""
 
         if self._slave_mode:
             return True
 
         if self._upnp_device is None:
-            for entry in self.upnp_discover(UPNP_TIMEOUT):
-                if entry.friendly_name == \
-                        self._devicename:
-                    self._upnp_device = upnpclient.Device(entry.location)
-                    break
+            self._upnp_device = self.hass.data[DATA_UPNP].async_get_device(
+                host=self._host, friendly_name=self._devicename)
+            if self._upnp_device is not None and self._traffic is not None:
+                self._upnp_device = self._traffic.upnp_device(
+                    self._host, self._upnp_device)
 
-        self._lpapi.call('GET', 'getPlayerStatus')
-        player_api_result = self._lpapi.data
+        if self._upnp_events and self._upnp_device is not None and \
+                not self._upnp_subscriptions:
+            await self._async_subscribe_upnp_events()
+
+        player_api_result = await self._lpapi.call(
+            'GET', 'getPlayerStatus', priority=PRIORITY_POLL)
 
         if player_api_result is None:
-            _LOGGER.warning('Unable to connect to device')
-            self._media_title = 'Unable to connect to device'
+            self._unreachable_polls += 1
+            # Slaves are unavailable together with their master
+            self._multiroom.async_update()
             return True
+        if self._unreachable_polls and self._upnp_subscriptions:
+            # Device could be rebooted and have forgotten its subscriptions
+            self.hass.async_create_task(
+                self._async_resubscribe_upnp_events())
+        self._unreachable_polls = 0
 
         try:
-            player_status = json.loads(player_api_result)
-        except ValueError:
-            _LOGGER.warning("REST result could not be parsed as JSON")
+            player_status = PlayerStatus(json.loads(player_api_result))
+        except (KeyError, TypeError, ValueError):
+            _LOGGER.warning("REST result could not be parsed as player status")
             _LOGGER.debug("Erroneous JSON: %s", player_api_result)
             player_status = None
 
-        if isinstance(player_status, dict):
-            self._lpapi.call('GET', 'getStatus')
-            device_api_result = self._lpapi.data
-            if device_api_result is None:
-                _LOGGER.warning('Unable to connect to device')
-                self._media_title = 'Unable to connect to device'
-                return True
+        if player_status is not None:
+            prev_status = self._player_status
+            self._player_status = player_status
+            if prev_status is None or player_status.mode != prev_status.mode:
+                self.invalidate_device_status()
+                self.invalidate_topology()
 
-            try:
-                device_status = json.loads(device_api_result)
-            except ValueError:
-                _LOGGER.warning("REST result could not be parsed as JSON")
-                _LOGGER.debug("Erroneous JSON: %s", device_api_result)
-                device_status = None
-
-            if isinstance(device_status, dict):
-                self._wifi_channel = device_status['WifiChannel']
-                self._ssid = \
-                    binascii.hexlify(device_status['ssid'].encode('utf-8'))
-                self._ssid = self._ssid.decode()
+            if not await self._async_update_device_status():
+                self._multiroom.async_update()
+                return True
 
             # Update variables that changes during playback of a track.
-            self._volume = player_status['vol']
-            self._muted = player_status['mute']
-            self._seek_position = int(int(player_status['curpos']) / 1000)
-            self._position_updated_at = utcnow()
-            try:
-                self._media_uri = str(bytearray.fromhex(
-                    player_status['iuri']).decode())
-            except KeyError:
-                self._media_uri = None
-            self._state = {
-                'stop': STATE_PAUSED,
-                'play': STATE_PLAYING,
-                'pause': STATE_PAUSED,
-            }.get(player_status['status'], STATE_UNKNOWN)
-            self._source = SOURCES_MAP.get(player_status['mode'],
-                                           'WiFi')
-            self._sound_mode = SOUND_MODES.get(player_status['eq'])
-            self._shuffle = (player_status['loop'] == '2')
-            self._playing_spotify = bool(player_status['mode'] == '31')
-
-            self._new_song = self._is_playing_new_track(player_status)
-            if self._playing_spotify or player_status['totlen'] == '0':
-                self._update_via_upnp()
-
-            elif self._media_uri is not None and self._new_song:
-                self._update_from_id3()
-                if self._lfmapi is not None and \
-                        self._media_title is not None:
-                    self._get_lastfm_coverart()
-                else:
-                    self._media_image_url = None
-
-            self._duration = int(int(player_status['totlen']) / 1000)
-
-        else:
-            _LOGGER.warning("JSON result was not a dictionary")
+            # Values of commands being sent are not reverted by the poll
+            if not self._commands.is_busy('vol'):
+                self._volume = player_status.volume
+            if not self._commands.is_busy('mute'):
+                self._muted = player_status.muted
+            if not self._commands.is_busy('seek'):
+                self._update_position(player_status.position,
+                                      player_status.state)
+            self._state = player_status.state
+            self._source = player_status.source
+            self._sound_mode = player_status.sound_mode
+            self._shuffle = player_status.shuffle
+
+            new_song = self._is_playing_new_track(player_status)
+            if player_status.playing_spotify or player_status.playing_stream:
+                self._async_lookup_metadata(self._async_update_via_upnp)
+
+            elif self._media_uri is not None and new_song:
+                self._upnp_metadata = None
+                self._media_title = None
+                self._media_artist = None
+                self._media_album = None
+                self._media_image_url = None
+                self._async_lookup_metadata(self._async_update_track_info,
+                                            self._media_uri)
+
+            self._duration = player_status.duration
+
+        await self._async_update_topology()
+        self._multiroom.async_update()
+        return True
 
-        # Get multiroom slave information
-        self._lpapi.call('GET', 'multiroom:getSlaveList')
-        slave_list = self._lpapi.data
 
+class HttpSessionPool:
+    """Pool of keep-alive HTTP connections shared by all devices.
+
+    Requests fail with ClientConnectionError once the pool is closed.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE,
+                 idle_timeout=HTTP_POOL_IDLE_TIMEOUT):
+        """Initialize the pool."""
+        self._pool_size = pool_size
+        self._idle_timeout = idle_timeout
+        self._session = None
+        self._closed = False
+
+    def _get_session(self):
+        """Return client session, create it if necessary."""
+        if self._closed:
+            raise aiohttp.ClientConnectionError("HTTP session pool is closed")
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self._pool_size,
+                keepalive_timeout=self._idle_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _fetch(self, method, url, timeout):
+        """Send request and return (text, size in bytes) of response."""
+        async with self._get_session().request(
+                method, url, timeout=timeout) as response:
+            body = await response.read()
+            return await response.text(), len(body)
+
+    async def request(self, method, url, timeout, retry=False):
+        """Send request over pooled connection.
+
+        Return tuple (text, size) of the response, size is the number of
+        bytes received in the body.
+
+        With retry the request is repeated once if the connection was
+        dropped. Use it only for requests which are safe to repeat.
+        """
+        timeout = aiohttp.ClientTimeout(total=timeout)
         try:
-            slave_list = json.loads(slave_list)
-        except ValueError:
-            _LOGGER.warning("REST result could not be parsed as JSON")
-            _LOGGER.debug("Erroneous JSON: %s", slave_list)
-            slave_list = None
-
-        self._slave_list = []
-        if isinstance(slave_list, dict):
-            if int(slave_list['slaves']) > 0:
-                for slave in slave_list['slave_list']:
-                    device = self.hass.data[DATA_LINKPLAY].get(slave['name'])
-                    if device:
-                        self._slave_list.append(device)
-                        device.set_master(self)
-                        device.set_slave_mode(True)
-                        device.set_media_title("Slave mode")
-                        device.set_media_artist(self.name)
-                        device.set_volume(slave['volume'])
-                        device.set_muted(slave['mute'])
-                        device.set_state(self.state)
-                        device.set_slave_ip(slave['ip'])
-                        device.set_seek_position(self.media_position)
-                        device.set_duration(self.media_duration)
-                        device.set_position_updated_at(
-                            self.media_position_updated_at)
-                        device.set_source(self._source)
-                        device.set_sound_mode(self._sound_mode)
-        else:
-            _LOGGER.warning("JSON result was not a dictionary")
-
-        return True
+            return await self._fetch(method, url, timeout)
+        except aiohttp.ClientConnectorError:
+            raise
+        except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError) as ex:
+            if not retry:
+                raise
+            # Kept-alive connection could be dropped by the remote side
+            # (e.g. device was rebooted). Reconnect once.
+            _LOGGER.debug("Reconnecting to %s: %s", url, ex)
+            return await self._fetch(method, url, timeout)
+
+    async def async_close(self):
+        """Close all pooled connections and refuse further requests."""
+        self._closed = True
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
 
 # pylint: disable=R0903
 class LinkPlayRestData:
     """Class for handling the data retrieval from the LinkPlay device."""
 
-    def __init__(self, host):
+    def __init__(self, host, transport, stats=None):
         """Initialize the data object."""
         self.data = None
-        self._request = None
         self._host = host
+        self._stats = stats if stats is not None else DeviceStats()
+        self._transport = transport
+        self._scheduler = RequestScheduler()
+        self._breaker = CircuitBreaker()
 
-    def call(self, method, cmd):
-        """Get the latest data from REST service."""
-        self.data = None
-        self._request = None
+    @property
+    def available(self):
+        """Return False while requests to the device fail."""
+        return self._breaker.available
+
+    async def call(self, method, cmd, timeout=None,
+                   priority=PRIORITY_COMMAND):
+        """Get the latest data from REST service.
+
+        Requests to the device are sent one at a time, commands go ahead of
+        polls (PRIORITY_POLL).
+        """
+        self.data = await self._scheduler.async_request(
+            partial(self._async_request, method, cmd, timeout), priority,
+            key=cmd)
+        return self.data
+
+    async def _async_request(self, method, cmd, timeout):
+        """Send request to the device.
+
+        Requests fail fast while the circuit breaker is open. Unavailable
+        device is probed with a short timeout.
+        """
+        if not self._breaker.allow_request():
+            _LOGGER.debug("Device %s is unavailable, skip %s",
+                          self._host, cmd)
+            return None
+        retry = command_name(cmd) in HTTP_RETRY_COMMANDS
+        if self._breaker.state == BREAKER_HALF_OPEN:
+            timeout = PROBE_TIMEOUT
+            retry = False
         resource = "http://{0}/httpapi.asp?command={1}".format(self._host, cmd)
-        self._request = requests.Request(method, resource).prepare()
 
-        _LOGGER.debug("Updating from %s", self._request.url)
+        _LOGGER.debug("Updating from %s", resource)
+        start = time.monotonic()
         try:
-            with requests.Session() as sess:
-                response = sess.send(
-                    self._request, timeout=2)
-            self.data = response.text
-
-        except requests.exceptions.RequestException as ex:
-            _LOGGER.error("Error fetching data: %s from %s failed with %s",
-                          self._request, self._request.url, ex)
-            self.data = None
+            result, size = await self._transport.request(
+                method, resource, timeout=timeout or 2, retry=retry)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            self._stats.record(
+                'http', command_name(cmd), time.monotonic() - start,
+                RESULT_TIMEOUT if isinstance(ex, asyncio.TimeoutError)
+                else RESULT_ERROR)
+            if self._breaker.record_failure():
+                _LOGGER.error("Error fetching data: %s %s failed with %r. "
+                              "Device is unavailable", method, resource, ex)
+            else:
+                _LOGGER.debug("Error fetching data: %s %s failed with %r",
+                              method, resource, ex)
+            return None
+
+        self._stats.record('http', command_name(cmd),
+                           time.monotonic() - start, size=size)
+        if self._breaker.record_success():
+            _LOGGER.info("Connection to device %s restored", self._host)
+        return result
 
 
 # pylint: disable=R0903
 class LastFMRestData:
     """Class for handling the data retrieval from the LinkPlay device."""
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, transport, stats=None):
         """Initialize the data object."""
         self.data = None
-        self._request = None
         self._api_key = api_key
+        self._stats = stats if stats is not None else DeviceStats()
+        self._transport = transport
 
-    def call(self, method, cmd, params):
+    async def call(self, method, cmd, params):
         """Get the latest data from REST service."""
         self.data = None
-        self._request = None
         resource = "{0}{1}&{2}&api_key={3}&format=json".format(
             LASTFM_API_BASE, cmd, params, self._api_key)
-        self._request = requests.Request(method, resource).prepare()
-        _LOGGER.debug("Updating from %s", self._request.url)
+        _LOGGER.debug("Updating from %s", resource)
 
+        start = time.monotonic()
         try:
-            with requests.Session() as sess:
-                response = sess.send(
-                    self._request, timeout=10)
-            self.data = response.text
-
-        except requests.exceptions.RequestException as ex:
-            _LOGGER.error("Error fetching data: %s from %s failed with %s",
-                          self._request, self._request.url, ex)
+            self.data, size = await self._transport.request(
+                method, resource, timeout=10, retry=True)
+            self._stats.record('lastfm', cmd, time.monotonic() - start,
+                               size=size)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            self._stats.record(
+                'lastfm', cmd, time.monotonic() - start,
+                RESULT_TIMEOUT if isinstance(ex, asyncio.TimeoutError)
+                else RESULT_ERROR)
+            _LOGGER.error("Error fetching data: %s %s failed with %r",
+                          method, resource, ex)
             self.data = None
+        return self.data
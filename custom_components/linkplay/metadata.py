@@ -0,0 +1,307 @@
+"""
+Track metadata helpers for LinkPlay based devices.
+
+For more details about this platform, please refer to the documentation at
+https://home-assistant.io/components/media_player.linkplay/
+"""
+
+import asyncio
+import io
+import json
+import logging
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from homeassistant.core import callback
+
+from . import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+ID3V2_HEADER_SIZE = 10
+ID3V1_SIZE = 128
+ID3_CHUNK_SIZE = 4096
+ID3_MAX_TAG_SIZE = 4 * 1024 * 1024
+ID3_TIMEOUT = 10
+
+METADATA_CACHE_SIZE = 500
+METADATA_CACHE_MAX_AGE = 30 * 24 * 3600
+METADATA_CACHE_SAVE_DELAY = 60
+STORAGE_KEY = DOMAIN + '_metadata'
+STORAGE_VERSION = 1
+
+LASTFM_CACHE_SIZE = 1000
+LASTFM_CACHE_TTL = 7 * 24 * 3600
+LASTFM_NEGATIVE_TTL = 24 * 3600
+LASTFM_MIN_INTERVAL = 0.25
+
+METADATA_WORKERS = 4
+
+
+def id3v2_tag_size(header):
+    """Return full size of ID3v2 tag from its header or None if no tag."""
+    if len(header) < ID3V2_HEADER_SIZE or header[:3] != b'ID3':
+        return None
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7f)
+    size += ID3V2_HEADER_SIZE
+    if header[5] & 0x10:
+        # Footer is present
+        size += ID3V2_HEADER_SIZE
+    return size
+
+
+async def async_read_range(session, url, start, stop=None):
+    """Read bytes [start, stop) of remote file.
+
+    Negative start means that many bytes from the end of file. Return tuple
+    (data, ranged). If the server ignores Range header (ranged is False),
+    only the beginning of the stream is read and the tail of the file is
+    reported as empty.
+    """
+    if start < 0:
+        byte_range = 'bytes={0}'.format(start)
+    else:
+        byte_range = 'bytes={0}-{1}'.format(start, stop - 1)
+    async with session.get(
+            url, headers={'Range': byte_range},
+            timeout=aiohttp.ClientTimeout(total=ID3_TIMEOUT)) as response:
+        response.raise_for_status()
+        if response.status == 206:
+            return await response.read(), True
+        if start < 0:
+            return b'', False
+        data = b''
+        while len(data) < stop:
+            chunk = await response.content.read(stop - len(data))
+            if not chunk:
+                break
+            data += chunk
+        # Leaving context with unread body drops the connection
+        return data[start:stop], False
+
+
+def parse_id3_tag(data, version, name):
+    """Parse ID3 tag from memory buffer into (title, artist, album)."""
+    import eyed3.id3
+
+    buf = io.BytesIO(data)
+    buf.name = name
+    tag = eyed3.id3.Tag()
+    if not data or not tag.parse(buf, version):
+        return None, None, None
+    return tag.title, tag.artist, tag.album
+
+
+async def async_read_id3_tags(session, url, read_range=async_read_range):
+    """Read (title, artist, album) of remote audio file.
+
+    Only the ID3v2 tag at the start of the file (or ID3v1 tag at its end)
+    is downloaded using HTTP Range requests (by read_range).
+    """
+    import eyed3.id3
+
+    try:
+        data, ranged = await read_range(session, url, 0, ID3_CHUNK_SIZE)
+        size = id3v2_tag_size(data)
+        if size is None:
+            if not ranged:
+                _LOGGER.debug("Server ignores Range header, skip ID3v1 tag"
+                              " of %s", url)
+                return None, None, None
+            data, _ = await read_range(session, url, -ID3V1_SIZE)
+            return parse_id3_tag(data, eyed3.id3.ID3_V1, url)
+
+        if size > ID3_MAX_TAG_SIZE:
+            _LOGGER.debug("ID3 tag of %s is too large: %d", url, size)
+            return None, None, None
+        if size > len(data):
+            data += (await read_range(session, url, len(data), size))[0]
+        return parse_id3_tag(data[:size], eyed3.id3.ID3_V2, url)
+
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError,
+            eyed3.Error) as exc:
+        _LOGGER.debug("Unable to read ID3 tag of %s: %r", url, exc)
+        return None, None, None
+
+
+class MetadataCache:
+    """LRU cache of track metadata keyed by media URI.
+
+    Values are (title, artist, album, image_url) tuples. Entries are evicted
+    when the cache is full or after max_age seconds. If a store is loaded,
+    the cache is saved to it and survives restarts.
+    """
+
+    def __init__(self, max_size=METADATA_CACHE_SIZE,
+                 max_age=METADATA_CACHE_MAX_AGE):
+        """Initialize the cache."""
+        self._max_size = max_size
+        self._max_age = max_age
+        self._entries = OrderedDict()
+        self._store = None
+
+    @property
+    def persistent(self):
+        """Return True if the cache is saved to a store."""
+        return self._store is not None
+
+    async def async_load(self, store):
+        """Load entries from homeassistant.helpers.storage.Store."""
+        self._store = store
+        data = await store.async_load() or {}
+        for key, value in data.items():
+            self._entries[key] = (tuple(value[:4]), value[4])
+        self._evict()
+
+    def get(self, key):
+        """Return cached value or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self._max_age:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value):
+        """Store value, evicting least recently used entries."""
+        self._entries[key] = (tuple(value), time.time())
+        self._entries.move_to_end(key)
+        self._evict()
+        if self._store is not None:
+            self._store.async_delay_save(self._data_to_save,
+                                         METADATA_CACHE_SAVE_DELAY)
+
+    def _evict(self):
+        """Drop entries over size limit."""
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    @callback
+    def _data_to_save(self):
+        """Return data of the cache to store."""
+        return {key: list(value) + [timestamp]
+                for key, (value, timestamp) in self._entries.items()}
+
+
+class LastFMCoverResolver:
+    """Shared resolver of album covers via last.fm track.getInfo.
+
+    Found covers are cached for LASTFM_CACHE_TTL seconds, tracks without
+    cover for LASTFM_NEGATIVE_TTL seconds. Error replies are not cached. Concurrent lookups of the same
+    track share one request and requests are spaced by LASTFM_MIN_INTERVAL
+    to stay inside last.fm rate limits.
+    """
+
+    def __init__(self, min_interval=LASTFM_MIN_INTERVAL):
+        """Initialize the resolver."""
+        self._min_interval = min_interval
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = asyncio.Lock()
+        self._next_request = 0
+
+    def _cached(self, key):
+        """Return (found, image_url) from cache."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+        if time.monotonic() > entry[1]:
+            del self._cache[key]
+            return False, None
+        self._cache.move_to_end(key)
+        return True, entry[0]
+
+    def _store(self, key, image_url):
+        """Cache lookup result."""
+        ttl = LASTFM_CACHE_TTL if image_url else LASTFM_NEGATIVE_TTL
+        self._cache[key] = (image_url, time.monotonic() + ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > LASTFM_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    async def async_get_cover(self, api, artist, title):
+        """Return cover URL of the track or None."""
+        key = (artist, title)
+        found, image_url = self._cached(key)
+        if found:
+            return image_url
+        if key not in self._pending:
+            self._pending[key] = asyncio.ensure_future(
+                self._async_lookup(api, key))
+        return await asyncio.shield(self._pending[key])
+
+    async def _async_lookup(self, api, key):
+        """Request cover from last.fm respecting rate limit."""
+        try:
+            async with self._lock:
+                delay = self._next_request - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._next_request = time.monotonic() + self._min_interval
+            lfmdata = await api.call('GET', 'track.getInfo',
+                                     "artist={0}&track={1}".format(*key))
+            if lfmdata is None:
+                # Connection error, do not cache
+                return None
+            try:
+                track = json.loads(lfmdata)['track']
+            except (TypeError, ValueError, KeyError):
+                # Error reply (e.g. rate limit exceeded), do not cache
+                _LOGGER.debug("Unexpected last.fm reply: %s", lfmdata)
+                return None
+            try:
+                image_url = track['album']['image'][2]['#text'] or None
+            except (TypeError, KeyError, IndexError):
+                image_url = None
+            self._store(key, image_url)
+            return image_url
+        finally:
+            del self._pending[key]
+
+
+class MetadataWorkerPool:
+    """Bounded pool running metadata lookup jobs in background.
+
+    Every owner (device) has at most one job. Submitting a new job cancels
+    the stale one, e.g. when the track changes in the middle of a lookup.
+    """
+
+    def __init__(self, hass, workers=METADATA_WORKERS):
+        """Initialize the pool."""
+        self._hass = hass
+        self._semaphore = asyncio.Semaphore(workers)
+        # Entities are not hashable, so jobs are keyed by id() of the owner
+        self._jobs = {}
+
+    @callback
+    def async_submit(self, owner, job, *args):
+        """Run coroutine function job(*args) in background."""
+        self.async_cancel(owner)
+        self._jobs[id(owner)] = self._hass.async_create_task(
+            self._async_run(owner, job, *args))
+
+    @callback
+    def async_cancel(self, owner):
+        """Cancel job of the owner if any."""
+        task = self._jobs.pop(id(owner), None)
+        if task is not None:
+            task.cancel()
+
+    async def _async_run(self, owner, job, *args):
+        """Run job when a worker is free."""
+        try:
+            async with self._semaphore:
+                await job(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # pylint: disable=W0703
+            _LOGGER.warning("Metadata lookup for %s failed: %r", owner, exc)
+        finally:
+            if self._jobs.get(id(owner)) is asyncio.current_task():
+                del self._jobs[id(owner)]
@@ -0,0 +1,64 @@
+"""
+Multiroom helpers for LinkPlay based devices.
+
+For more details about this platform, please refer to the documentation at
+https://home-assistant.io/components/media_player.linkplay/
+"""
+
+from homeassistant.core import callback
+
+
+def _contains(devices, device):
+    """Return True if device is in the list."""
+    return any(item is device for item in devices)
+
+
+class MultiroomGroup:
+    """Multiroom group of a master device and its slaves.
+
+    Slaves read playback state of the group through the master, so only
+    volume, mute and IP address are kept per slave. Slaves states are
+    written to Home Assistant only when the master playback state or their
+    own overlay has changed.
+    """
+
+    def __init__(self, master):
+        """Initialize the group."""
+        self.master = master
+        self.slaves = []
+        self._snapshot = None
+
+    @callback
+    def async_set_members(self, members):
+        """Set slaves of the group from (device, slave_info) pairs.
+
+        slave_info is an entry of multiroom:getSlaveList slave_list. Former
+        slaves missing from members are released and polled on their own.
+        """
+        slaves = []
+        for device, info in members:
+            slaves.append(device)
+            changed = device.join_group(self.master, info['ip'],
+                                        info['volume'], info['mute'])
+            if changed or not _contains(self.slaves, device):
+                device.async_schedule_update_ha_state()
+        for device in self.slaves:
+            if not _contains(slaves, device) and \
+                    device.leave_group(self.master):
+                device.async_schedule_update_ha_state()
+                device.async_poll_soon()
+        self.slaves = slaves
+
+    @callback
+    def async_update(self):
+        """Write slaves states if the master playback state has changed.
+
+        The snapshot includes availability of the master, so slaves go
+        unavailable together with it.
+        """
+        snapshot = self.master.playback_snapshot()
+        if snapshot == self._snapshot:
+            return
+        self._snapshot = snapshot
+        for device in self.slaves:
+            device.async_schedule_update_ha_state()
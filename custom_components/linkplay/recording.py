@@ -0,0 +1,317 @@
+"""
+Recording and replay of traffic of LinkPlay based devices.
+
+For more details about this platform, please refer to the documentation at
+https://home-assistant.io/components/media_player.linkplay/
+"""
+
+import asyncio
+import base64
+import gzip
+import json
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import aiohttp
+
+SOURCE_HTTP = 'http'
+SOURCE_UPNP = 'upnp'
+SOURCE_ID3 = 'id3'
+
+ERROR_TIMEOUT = 'timeout'
+
+RECORDING_FLUSH_SIZE = 100
+
+_PRIVATE_PARAMS = ('api_key',)
+
+
+def request_key(url):
+    """Return URL without scheme, host and private parameters.
+
+    Recordings of different devices and hosts share the same keys, API keys
+    are never written to disk.
+    """
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, True)
+             if name not in _PRIVATE_PARAMS]
+    if not query:
+        return parts.path
+    return '{0}?{1}'.format(parts.path, urlencode(query))
+
+
+def range_key(url, start, stop=None):
+    """Return key of byte range request."""
+    return '{0} {1}:{2}'.format(url, start, '' if stop is None else stop)
+
+
+def _encode_response(result):
+    """Return text of HTTP transport result."""
+    return result[0]
+
+
+def _encode_range(result):
+    """Return result of byte range reader with data encoded as text."""
+    data, ranged = result
+    return [base64.b64encode(data).decode(), ranged]
+
+
+class TrafficRecorder:
+    """Record HTTP, UPnP and ID3 exchanges of devices to a file.
+
+    The file is gzipped JSON lines, one exchange per line:
+    {"t": seconds since start, "h": device host, "s": source, "k": key,
+     "r": response} or "e" with error instead of "r".
+    """
+
+    def __init__(self, hass, path):
+        """Initialize the recorder."""
+        self._hass = hass
+        self._path = path
+        self._start = time.monotonic()
+        self._buffer = []
+        self._lock = asyncio.Lock()
+
+    @property
+    def path(self):
+        """Path of the recording."""
+        return self._path
+
+    def record(self, host, source, key, response=None, error=None):
+        """Add one exchange. Must be run in the event loop."""
+        entry = {'t': round(time.monotonic() - self._start, 3), 'h': host,
+                 's': source, 'k': key}
+        if error is not None:
+            entry['e'] = error
+        else:
+            entry['r'] = response
+        self._buffer.append(json.dumps(entry, default=str) + '\n')
+        if len(self._buffer) == RECORDING_FLUSH_SIZE:
+            self._hass.async_create_task(self.async_flush())
+
+    async def async_flush(self):
+        """Append buffered exchanges to the file."""
+        async with self._lock:
+            lines, self._buffer = self._buffer, []
+            if lines:
+                await self._hass.async_add_executor_job(
+                    self._write, lines)
+
+    def _write(self, lines):
+        """Append lines to the file. This is a blocking call."""
+        with gzip.open(self._path, 'at', encoding='utf-8') as output:
+            output.writelines(lines)
+
+    def record_threadsafe(self, host, source, key, response):
+        """Add one exchange from executor thread."""
+        self._hass.loop.call_soon_threadsafe(self.record, host, source, key,
+                                             response)
+
+    # pylint: disable=R0913
+    async def async_record(self, host, source, key, awaitable, encode=None):
+        """Await request and record its result, encoded if necessary."""
+        try:
+            response = await awaitable
+        except asyncio.TimeoutError:
+            self.record(host, source, key, error=ERROR_TIMEOUT)
+            raise
+        except aiohttp.ClientError as ex:
+            self.record(host, source, key, error=repr(ex))
+            raise
+        self.record(host, source, key,
+                    response if encode is None else encode(response))
+        return response
+
+    def transport(self, host, transport):
+        """Return HTTP transport of the device recording its requests."""
+        return RecordingTransport(self, host, transport)
+
+    def read_range(self, host, read_range):
+        """Return byte range reader of the device recording its requests."""
+        async def async_read_range(session, url, start, stop=None):
+            """Read bytes of remote file and record them."""
+            return await self.async_record(
+                host, SOURCE_ID3, range_key(url, start, stop),
+                read_range(session, url, start, stop), _encode_range)
+        return async_read_range
+
+    def upnp_device(self, host, device):
+        """Return UPnP device proxy recording responses to actions."""
+        if device is None:
+            return None
+        return _RecordingProxy(self, host, device)
+
+
+class RecordingTransport:
+    """HTTP transport recording responses of another transport."""
+
+    def __init__(self, recorder, host, transport):
+        """Initialize the transport."""
+        self._recorder = recorder
+        self._host = host
+        self._transport = transport
+
+    async def request(self, method, url, timeout, retry=False):
+        """Send request and record response text."""
+        return await self._recorder.async_record(
+            self._host, SOURCE_HTTP, request_key(url),
+            self._transport.request(method, url, timeout, retry),
+            _encode_response)
+
+
+# pylint: disable=R0903
+class _RecordingProxy:
+    """Proxy of UPnP device or service recording calls of actions.
+
+    Actions are called in executor threads, so exchanges are recorded via
+    the event loop.
+    """
+
+    def __init__(self, recorder, host, target, service=None):
+        """Initialize the proxy."""
+        self._recorder = recorder
+        self._host = host
+        self._target = target
+        self._service = service
+
+    def __getattr__(self, name):
+        """Wrap services of device and actions of service."""
+        value = getattr(self._target, name)
+        if name.startswith('_'):
+            return value
+        if self._service is None:
+            if name in getattr(self._target, 'service_map', {}):
+                return _RecordingProxy(self._recorder, self._host, value,
+                                       name)
+            return value
+        if not callable(value):
+            return value
+
+        key = '{0}.{1}'.format(self._service, name)
+
+        def call(*args, **kwargs):
+            """Call the action and record its response."""
+            response = value(*args, **kwargs)
+            self._recorder.record_threadsafe(self._host, SOURCE_UPNP, key,
+                                             response)
+            return response
+        return call
+
+
+class TrafficReplay:
+    """Feed recorded exchanges back to devices.
+
+    Responses of every device, source and key are replayed in recorded
+    order, the last one is repeated when the recording runs out.
+    """
+
+    def __init__(self, entries):
+        """Initialize the replay from list of recorded entries."""
+        self._exchanges = {}
+        self._positions = {}
+        self.hosts = []
+        for entry in entries:
+            if entry['h'] not in self.hosts:
+                self.hosts.append(entry['h'])
+            self._exchanges.setdefault(
+                (entry['h'], entry['s'], entry['k']), []).append(entry)
+
+    @classmethod
+    def load(cls, path):
+        """Load recording from file. This is a blocking call."""
+        with gzip.open(path, 'rt', encoding='utf-8') as recording:
+            return cls([json.loads(line) for line in recording if line])
+
+    def count(self, host, source, key):
+        """Return number of recorded exchanges."""
+        return len(self._exchanges.get((host, source, key), ()))
+
+    def keys(self, host, source):
+        """Return keys of exchanges of the device recorded from source."""
+        return [key for (entry_host, entry_source, key) in self._exchanges
+                if entry_host == host and entry_source == source]
+
+    def responses(self, host, source, key):
+        """Return all recorded responses, skipping errors."""
+        return [entry['r'] for entry in
+                self._exchanges.get((host, source, key), ()) if 'r' in entry]
+
+    def rewind(self):
+        """Start the replay from the beginning."""
+        self._positions.clear()
+
+    def next_response(self, host, source, key):
+        """Return next recorded response or raise recorded error."""
+        exchanges = self._exchanges.get((host, source, key))
+        if not exchanges:
+            raise aiohttp.ClientError(
+                'No recorded response of {0} to {1}'.format(host, key))
+        position = self._positions.get((host, source, key), 0)
+        self._positions[(host, source, key)] = position + 1
+        entry = exchanges[min(position, len(exchanges) - 1)]
+        if 'e' not in entry:
+            return entry['r']
+        if entry['e'] == ERROR_TIMEOUT:
+            raise asyncio.TimeoutError()
+        raise aiohttp.ClientError(entry['e'])
+
+    def transport(self, host, transport=None):
+        """Return HTTP transport replaying requests of the device."""
+        return ReplayTransport(self, host)
+
+    def read_range(self, host, read_range=None):
+        """Return byte range reader replaying requests of the device."""
+        async def async_read_range(session, url, start, stop=None):
+            """Return recorded bytes of remote file."""
+            data, ranged = self.next_response(
+                host, SOURCE_ID3, range_key(url, start, stop))
+            return base64.b64decode(data), ranged
+        return async_read_range
+
+    def upnp_device(self, host, device=None):
+        """Return UPnP device replaying responses to actions."""
+        return _ReplayProxy(self, host)
+
+
+# pylint: disable=R0903
+class ReplayTransport:
+    """HTTP transport returning recorded responses."""
+
+    def __init__(self, replay, host):
+        """Initialize the transport."""
+        self._replay = replay
+        self._host = host
+
+    async def request(self, method, url, timeout, retry=False):
+        """Return recorded response text and its size in UTF-8."""
+        text = self._replay.next_response(self._host, SOURCE_HTTP,
+                                          request_key(url))
+        return text, len(text.encode())
+
+
+# pylint: disable=R0903
+class _ReplayProxy:
+    """UPnP device or service returning recorded responses to actions."""
+
+    def __init__(self, replay, host, service=None):
+        """Initialize the proxy."""
+        self._replay = replay
+        self._host = host
+        self._service = service
+        self.friendly_name = host
+        self.udn = 'uuid:replay-' + host
+        self.service_map = {}
+
+    def __getattr__(self, name):
+        """Return recorded service or action."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._service is None:
+            return _ReplayProxy(self._replay, self._host, name)
+
+        key = '{0}.{1}'.format(self._service, name)
+
+        # pylint: disable=W0613
+        def call(*args, **kwargs):
+            """Return recorded response to the action."""
+            return self._replay.next_response(self._host, SOURCE_UPNP, key)
+        return call
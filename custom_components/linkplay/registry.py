@@ -0,0 +1,86 @@
+"""
+Registry of LinkPlay devices.
+
+For more details about this platform, please refer to the documentation at
+https://home-assistant.io/components/media_player.linkplay/
+"""
+
+from homeassistant.core import callback
+
+INDEX_ENTITY_ID = 'entity_id'
+INDEX_NAME = 'name'
+INDEX_HOST = 'host'
+INDEX_UUID = 'uuid'
+
+
+def _device_keys(device):
+    """Return index keys of the device, skipping unknown ones."""
+    keys = {
+        INDEX_ENTITY_ID: device.entity_id,
+        INDEX_NAME: device.device_name,
+        INDEX_HOST: device.host,
+        INDEX_UUID: device.uuid.upper() if device.uuid else None,
+    }
+    return {index: key for index, key in keys.items() if key}
+
+
+class DeviceRegistry:
+    """Devices of the platform indexed by entity ID, name, host and UUID.
+
+    Devices are reindexed with async_update when their entity ID or UUID
+    becomes known.
+    """
+
+    def __init__(self):
+        """Initialize the registry."""
+        self._indexes = {INDEX_ENTITY_ID: {}, INDEX_NAME: {}, INDEX_HOST: {},
+                         INDEX_UUID: {}}
+        self._devices = {}
+
+    def __iter__(self):
+        """Iterate over registered devices."""
+        return iter(self.values())
+
+    def __len__(self):
+        """Return number of registered devices."""
+        return len(self._devices)
+
+    def values(self):
+        """Return list of registered devices."""
+        return [device for device, _ in self._devices.values()]
+
+    @callback
+    def async_register(self, device):
+        """Add device to the registry or reindex it."""
+        self.async_unregister(device)
+        keys = _device_keys(device)
+        self._devices[id(device)] = (device, keys)
+        for index, key in keys.items():
+            self._indexes[index][key] = device
+
+    async_update = async_register
+
+    @callback
+    def async_unregister(self, device):
+        """Remove device from the registry."""
+        _, keys = self._devices.pop(id(device), (None, {}))
+        for index, key in keys.items():
+            if self._indexes[index].get(key) is device:
+                del self._indexes[index][key]
+
+    def get(self, index, key):
+        """Return device by key of the index or None."""
+        if not key:
+            return None
+        if index == INDEX_UUID:
+            key = key.upper()
+        return self._indexes[index].get(key)
+
+    def get_by_entity_id(self, entity_id):
+        """Return device by entity ID or None."""
+        return self.get(INDEX_ENTITY_ID, entity_id)
+
+    def find(self, uuid=None, host=None, name=None):
+        """Return device by the most specific of known identifiers."""
+        return self.get(INDEX_UUID, uuid) or self.get(INDEX_HOST, host) or \
+            self.get(INDEX_NAME, name)
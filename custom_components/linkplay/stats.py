@@ -0,0 +1,154 @@
+"""
+Request statistics of LinkPlay based devices.
+
+For more details about this platform, please refer to the documentation at
+https://home-assistant.io/components/media_player.linkplay/
+"""
+
+import re
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+RESULT_OK = 'ok'
+RESULT_ERROR = 'error'
+RESULT_TIMEOUT = 'timeout'
+
+_COMMAND_NAME = re.compile(r'^[A-Za-z_]+$')
+
+
+def command_name(cmd):
+    """Return command without arguments, e.g. setPlayerCmd:vol."""
+    parts = []
+    for part in cmd.split(':'):
+        if not _COMMAND_NAME.match(part):
+            break
+        parts.append(part)
+    return ':'.join(parts) or cmd
+
+
+class CommandStats:
+    """Latency histogram and counters of one command."""
+
+    __slots__ = ('count', 'errors', 'timeouts', 'bytes', 'total_time',
+                 'max_time', 'buckets')
+
+    def __init__(self):
+        """Initialize the statistics."""
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.bytes = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def record(self, duration, result=RESULT_OK, size=0):
+        """Add one request."""
+        self.count += 1
+        if result == RESULT_ERROR:
+            self.errors += 1
+        elif result == RESULT_TIMEOUT:
+            self.timeouts += 1
+        self.bytes += size
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+                break
+
+    def as_dict(self):
+        """Return summary of the statistics."""
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'bytes': self.bytes,
+            'avg_ms': round(self.total_time / self.count * 1000, 1)
+                      if self.count else 0,
+            'max_ms': round(self.max_time * 1000, 1),
+        }
+
+
+class DeviceStats:
+    """Statistics of requests of one device, grouped by source and command.
+
+    Sources are 'http' for LinkPlay HTTP API, 'upnp', 'lastfm' and 'update'
+    for whole device updates.
+    """
+
+    def __init__(self):
+        """Initialize the statistics."""
+        self._commands = {}
+
+    def record(self, source, command, duration, result=RESULT_OK, size=0):
+        """Add one request."""
+        key = (source, command)
+        stats = self._commands.get(key)
+        if stats is None:
+            stats = self._commands[key] = CommandStats()
+        stats.record(duration, result, size)
+
+    def items(self):
+        """Return list of ((source, command), CommandStats)."""
+        return sorted(self._commands.items())
+
+    def as_dict(self):
+        """Return summary of the statistics for diagnostics."""
+        return {'{0} {1}'.format(*key): stats.as_dict()
+                for key, stats in self.items()}
+
+    def totals(self):
+        """Return (requests, errors, timeouts) of the device."""
+        requests = errors = timeouts = 0
+        for (source, _), stats in self._commands.items():
+            if source == 'update':
+                continue
+            requests += stats.count
+            errors += stats.errors
+            timeouts += stats.timeouts
+        return requests, errors, timeouts
+
+
+def _label(value):
+    """Escape Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def prometheus_text(devices):
+    """Return statistics of (entity_id, DeviceStats) in Prometheus format."""
+    lines = [
+        '# HELP linkplay_request_duration_seconds Duration of requests.',
+        '# TYPE linkplay_request_duration_seconds histogram',
+    ]
+    counters = []
+    for entity_id, device_stats in devices:
+        for (source, command), stats in device_stats.items():
+            labels = 'entity_id="{0}",source="{1}",command="{2}"'.format(
+                _label(entity_id), _label(source), _label(command))
+            total = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                total += count
+                lines.append('linkplay_request_duration_seconds_bucket'
+                             '{{{0},le="{1}"}} {2}'.format(labels, bound,
+                                                           total))
+            lines.append('linkplay_request_duration_seconds_bucket'
+                         '{{{0},le="+Inf"}} {1}'.format(labels, stats.count))
+            lines.append('linkplay_request_duration_seconds_sum{{{0}}} '
+                         '{1}'.format(labels, stats.total_time))
+            lines.append('linkplay_request_duration_seconds_count{{{0}}} '
+                         '{1}'.format(labels, stats.count))
+            counters.append((labels, stats))
+
+    for name, attr, description in (
+            ('errors', 'errors', 'Failed requests.'),
+            ('timeouts', 'timeouts', 'Timed out requests.'),
+            ('received_bytes', 'bytes', 'Bytes received.')):
+        lines.append('# HELP linkplay_request_{0}_total {1}'.format(
+            name, description))
+        lines.append('# TYPE linkplay_request_{0}_total counter'.format(name))
+        for labels, stats in counters:
+            lines.append('linkplay_request_{0}_total{{{1}}} {2}'.format(
+                name, labels, getattr(stats, attr)))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,98 @@
+"""
+Player status model for LinkPlay based devices.
+
+For more details about this platform, please refer to the documentation at
+https://home-assistant.io/components/media_player.linkplay/
+"""
+
+from homeassistant.const import STATE_PAUSED, STATE_PLAYING, STATE_UNKNOWN
+
+SOUND_MODES = {'0': 'Normal', '1': 'Classic', '2': 'Pop', '3': 'Jazz',
+               '4': 'Vocal'}
+SOURCES_MAP = {'0': 'WiFi', '10': 'WiFi', '31': 'WiFi', '40': 'Line-in',
+               '41': 'Bluetooth', '43': 'Optical'}
+PLAYER_STATES = {'stop': STATE_PAUSED, 'play': STATE_PLAYING,
+                 'pause': STATE_PAUSED}
+
+MODE_SPOTIFY = '31'
+LOOP_SHUFFLE = '2'
+
+def _decode_hex(value):
+    """Decode hex encoded UTF-8 string, None if it is missing or invalid."""
+    if value is None:
+        return None
+    try:
+        return bytes.fromhex(value).decode('utf-8')
+    except ValueError:
+        return None
+
+
+class PlayerStatus:
+    """Immutable decoded getPlayerStatus response.
+
+    All fields are decoded once on creation except hex encoded strings,
+    which are decoded on first access only. Every field is set only once. Instances are shared by
+    reference, e.g. by a master device and its slaves.
+    """
+
+    __slots__ = ('mode', 'state', 'volume', 'muted', 'source', 'sound_mode',
+                 'shuffle', 'position', 'duration', '_iuri', '_title',
+                 '_media_uri', '_media_title')
+
+    def __init__(self, status):
+        """Decode raw status dict.
+
+        Raise KeyError, TypeError or ValueError on malformed status.
+        """
+        self.mode = status['mode']
+        self.state = PLAYER_STATES.get(status['status'], STATE_UNKNOWN)
+        self.volume = int(status['vol'])
+        self.muted = bool(int(status['mute']))
+        self.source = SOURCES_MAP.get(status['mode'], 'WiFi')
+        self.sound_mode = SOUND_MODES.get(status['eq'])
+        self.shuffle = status['loop'] == LOOP_SHUFFLE
+        self.position = int(status['curpos']) // 1000
+        self.duration = int(status['totlen']) // 1000
+        self._iuri = status.get('iuri')
+        self._title = status.get('Title')
+
+    def __setattr__(self, name, value):
+        """Set field once, forbid further modification of the status."""
+        if hasattr(self, name):
+            raise AttributeError("PlayerStatus is immutable")
+        object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        """Return representation of the status."""
+        return '<PlayerStatus {0} mode={1} pos={2}/{3}>'.format(
+            self.state, self.mode, self.position, self.duration)
+
+    @property
+    def playing_spotify(self):
+        """Return True if Spotify Connect is the source."""
+        return self.mode == MODE_SPOTIFY
+
+    @property
+    def playing_stream(self):
+        """Return True if a stream without duration (radio) is playing."""
+        return self.duration == 0
+
+    @property
+    def media_uri(self):
+        """Return URI of the current track."""
+        try:
+            return self._media_uri
+        except AttributeError:
+            # pylint: disable=W0201
+            self._media_uri = _decode_hex(self._iuri)
+            return self._media_uri
+
+    @property
+    def media_title(self):
+        """Return title of the current track as reported by the device."""
+        try:
+            return self._media_title
+        except AttributeError:
+            # pylint: disable=W0201
+            self._media_title = _decode_hex(self._title)
+            return self._media_title
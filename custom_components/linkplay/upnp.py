@@ -0,0 +1,480 @@
+"""
+UPnP helpers for LinkPlay based devices.
+
+For more details about this platform, please refer to the documentation at
+https://home-assistant.io/components/media_player.linkplay/
+"""
+
+import asyncio
+import logging
+import socket
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+from aiohttp import web
+import netdisco.ssdp
+import upnpclient
+
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.event import async_call_later
+
+_LOGGER = logging.getLogger(__name__)
+
+UPNP_TIMEOUT = 5
+
+DISCOVERY_TTL = 1800
+DISCOVERY_RESCAN_INTERVAL = 60
+
+SSDP_PORT = 1900
+SSDP_ST = 'urn:schemas-upnp-org:device:MediaRenderer:1'
+SSDP_UNICAST_TIMEOUT = 1
+UPNP_DESCRIPTION_URL = 'http://{0}:49152/description.xml'
+
+UPNP_EVENTS_PATH = '/linkplay/notify'
+UPNP_EVENTS_TIMEOUT = 1800
+UPNP_EVENTS_RETRY_INTERVAL = 60
+UPNP_REQUEST_TIMEOUT = 5
+
+DIDL_LITE_PATHS = tuple(
+    "{urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/}item/" + path for path in (
+        "{http://purl.org/dc/elements/1.1/}title",
+        "{urn:schemas-upnp-org:metadata-1-0/upnp/}artist",
+        "{urn:schemas-upnp-org:metadata-1-0/upnp/}album",
+        "{urn:schemas-upnp-org:metadata-1-0/upnp/}albumArtURI"))
+
+
+def parse_last_change(last_change):
+    """Parse LastChange event into dict of variable values.
+
+    Only Master channel values are taken for RenderingControl variables.
+    """
+    values = {}
+    xml_tree = ET.fromstring(last_change)
+    for instance in xml_tree:
+        for var in instance:
+            if var.get('channel', 'Master') != 'Master':
+                continue
+            values[var.tag.rpartition('}')[2]] = var.get('val')
+    return values
+
+
+def parse_didl_lite(metadata):
+    """Parse DIDL-Lite metadata into (title, artist, album, image) tuple.
+
+    Missing elements and malformed XML give None values.
+    """
+    try:
+        xml_tree = ET.fromstring(metadata)
+    except ET.ParseError as exc:
+        _LOGGER.debug("Unable to parse track metadata: %s", exc)
+        return (None,) * len(DIDL_LITE_PATHS)
+
+    result = []
+    for path in DIDL_LITE_PATHS:
+        element = xml_tree.find(path)
+        result.append(None if element is None else element.text)
+    return tuple(result)
+
+
+class SsdpUnicastProtocol(asyncio.DatagramProtocol):
+    """Send M-SEARCH straight to a host and wait for its LOCATION."""
+
+    def __init__(self, host, future):
+        """Initialize the protocol."""
+        self._host = host
+        self._future = future
+
+    def connection_made(self, transport):
+        """Send search request."""
+        transport.sendto('\r\n'.join([
+            'M-SEARCH * HTTP/1.1',
+            'HOST: {0}:{1}'.format(self._host, SSDP_PORT),
+            'MAN: "ssdp:discover"',
+            'MX: 1',
+            'ST: {0}'.format(SSDP_ST),
+            '', '']).encode())
+
+    def datagram_received(self, data, addr):
+        """Extract LOCATION header from the response."""
+        for line in data.decode(errors='replace').splitlines():
+            key, _, value = line.partition(':')
+            if key.strip().lower() == 'location' and not self._future.done():
+                self._future.set_result(value.strip())
+
+    def error_received(self, exc):
+        """Stop waiting on ICMP errors."""
+        if not self._future.done():
+            self._future.set_exception(exc)
+
+
+class UpnpDiscovery:
+    """Process-wide cache of UPnP devices found via SSDP.
+
+    One network scan serves all LinkPlay devices. Found devices are indexed
+    by location, USN, host and friendly name and kept for DISCOVERY_TTL
+    seconds. Lookups never block: a missing device only schedules a targeted
+    lookup of the host (or a background scan if the host is unknown or does
+    not answer).
+    """
+
+    def __init__(self, hass, timeout=UPNP_TIMEOUT, ttl=DISCOVERY_TTL,
+                 rescan_interval=DISCOVERY_RESCAN_INTERVAL):
+        """Initialize the discovery service."""
+        self._hass = hass
+        self._timeout = timeout
+        self._ttl = ttl
+        self._rescan_interval = rescan_interval
+        self._by_location = {}
+        self._by_usn = {}
+        self._by_name = {}
+        self._by_host = {}
+        self._expires = {}
+        self._last_scan = None
+        self._scan_task = None
+        self._host_tasks = {}
+        self._host_lookups = {}
+
+    # pylint: disable=R0913
+    @callback
+    def async_get_device(self, friendly_name=None, usn=None, location=None,
+                         host=None):
+        """Return cached UPnP device or None, looking up in background."""
+        self._async_expire()
+        device = None
+        if location is not None:
+            device = self._by_location.get(location)
+        if device is None and host is not None:
+            device = self._by_host.get(host)
+        if device is None and usn is not None:
+            device = self._by_usn.get(usn)
+        if device is None and friendly_name is not None:
+            device = self._by_name.get(friendly_name)
+        if device is None:
+            if host is not None:
+                self.async_request_host_lookup(host)
+            else:
+                self.async_request_scan()
+        return device
+
+    @callback
+    def async_request_host_lookup(self, host):
+        """Schedule targeted lookup of the host unless one is running."""
+        if host in self._host_tasks:
+            return
+        last_lookup = self._host_lookups.get(host)
+        if last_lookup is not None and \
+                time.monotonic() - last_lookup < self._rescan_interval:
+            return
+        self._host_tasks[host] = self._hass.async_create_task(
+            self._async_lookup_host(host))
+
+    async def _async_search_host(self, host):
+        """Send unicast M-SEARCH to the host and return its LOCATION."""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        transport = None
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: SsdpUnicastProtocol(host, future),
+                remote_addr=(host, SSDP_PORT))
+            return await asyncio.wait_for(future, SSDP_UNICAST_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as exc:
+            _LOGGER.debug("Unicast M-SEARCH to %s failed: %r", host, exc)
+            return None
+        finally:
+            if transport is not None:
+                transport.close()
+
+    async def _async_lookup_host(self, host):
+        """Fetch device description straight from the host."""
+        try:
+            location = await self._async_search_host(host) or \
+                UPNP_DESCRIPTION_URL.format(host)
+            try:
+                device = await self._hass.async_add_executor_job(
+                    upnpclient.Device, location)
+            except Exception as exc:  # pylint: disable=W0703
+                _LOGGER.debug('Error \'%s\' for %s', exc, location)
+                self.async_request_scan()
+                return
+            self._async_add(location, device, None, time.monotonic())
+            self._by_host[host] = device
+            _LOGGER.debug("UPnP device of %s found at %s", host, location)
+        finally:
+            self._host_lookups[host] = time.monotonic()
+            del self._host_tasks[host]
+
+    @callback
+    def async_request_scan(self, force=False):
+        """Schedule background network scan unless one is running."""
+        if self._scan_task is not None:
+            return
+        if not force and self._last_scan is not None and \
+                time.monotonic() - self._last_scan < self._rescan_interval:
+            return
+        self._scan_task = self._hass.async_create_task(self._async_scan())
+
+    async def _async_scan(self):
+        """Scan the network and update cache."""
+        try:
+            found = await self._hass.async_add_executor_job(
+                self._scan, dict(self._by_location))
+        finally:
+            self._last_scan = time.monotonic()
+            self._scan_task = None
+
+        now = time.monotonic()
+        for location, (device, usn) in found.items():
+            if device is not None:
+                self._async_add(location, device, usn, now)
+        _LOGGER.debug("UPnP discovery found %d device(s)", len(found))
+
+    @callback
+    def async_add_device(self, location, device, usn=None):
+        """Add UPnP device with known location to the cache."""
+        self._async_add(location, device, usn, time.monotonic())
+
+    @callback
+    def _async_add(self, location, device, usn, now):
+        """Add device to cache indexes."""
+        self._by_location[location] = device
+        self._by_name[device.friendly_name] = device
+        self._by_host[urlsplit(location).hostname] = device
+        for key in (usn, device.udn):
+            if key:
+                self._by_usn[key] = device
+        self._expires[location] = now + self._ttl
+
+    def _scan(self, known):
+        """Scan the network. This is a blocking call.
+
+        Descriptions are fetched only for locations not already in cache.
+        """
+        found = {}
+        for entry in netdisco.ssdp.scan(self._timeout):
+            location = entry.location
+            if location is None or location in found:
+                continue
+            device = known.get(location)
+            if device is None:
+                try:
+                    device = upnpclient.Device(location)
+                except Exception as exc:  # pylint: disable=W0703
+                    _LOGGER.debug('Error \'%s\' for %s', exc, location)
+            found[location] = (device, entry.values.get('usn'))
+        return found
+
+    @callback
+    def _async_expire(self):
+        """Drop cache entries older than TTL."""
+        now = time.monotonic()
+        for location, expires in list(self._expires.items()):
+            if expires > now:
+                continue
+            device = self._by_location.pop(location)
+            del self._expires[location]
+            for index in (self._by_usn, self._by_name, self._by_host):
+                for key in [key for key, value in index.items()
+                            if value is device]:
+                    del index[key]
+
+
+class UpnpSubscription:
+    """Subscription to events of one UPnP service with automatic renewal."""
+
+    def __init__(self, listener, host, url, event_callback):
+        """Initialize the subscription."""
+        self._listener = listener
+        self._host = host
+        self._url = url
+        self._event_callback = event_callback
+        self._unsub_renew = None
+        self._event_received = False
+        self.sid = None
+
+    @property
+    def active(self):
+        """Return True if events were delivered since (re)subscription.
+
+        A rebooted device silently forgets subscriptions, so events are
+        trusted only after one has arrived since the last renewal.
+        """
+        return self.sid is not None and self._event_received
+
+    async def _async_request(self, method, headers):
+        """Send (UN)SUBSCRIBE request and return response headers or None."""
+        try:
+            async with self._listener.session.request(
+                    method, self._url, headers=headers,
+                    timeout=aiohttp.ClientTimeout(
+                        total=UPNP_REQUEST_TIMEOUT)) as response:
+                if response.status != 200:
+                    _LOGGER.debug("%s %s rejected with status %s",
+                                  method, self._url, response.status)
+                    return None
+                return response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            _LOGGER.debug("%s %s failed: %r", method, self._url, exc)
+            return None
+
+    @callback
+    def _async_schedule_renew(self, headers):
+        """Schedule renewal before the subscription times out."""
+        delay = UPNP_EVENTS_RETRY_INTERVAL
+        if headers is not None:
+            timeout = headers.get('TIMEOUT', '').lower()
+            if timeout.startswith('second-') and timeout[7:].isdigit():
+                delay = max(int(timeout[7:]) // 2, 30)
+            else:
+                delay = UPNP_EVENTS_TIMEOUT // 2
+        self._unsub_renew = async_call_later(
+            self._listener.hass, delay, self._async_renew)
+
+    async def async_subscribe(self):
+        """Subscribe to service events. Return True on success."""
+        try:
+            callback_url = self._listener.callback_url(
+                urlsplit(self._url).hostname)
+        except OSError as exc:
+            _LOGGER.debug("No route to %s: %r", self._host, exc)
+            headers = None
+        else:
+            headers = await self._async_request('SUBSCRIBE', {
+                'CALLBACK': '<{0}>'.format(callback_url),
+                'NT': 'upnp:event',
+                'TIMEOUT': 'Second-{0}'.format(UPNP_EVENTS_TIMEOUT),
+            })
+        self._event_received = False
+        if headers is not None and headers.get('SID'):
+            self.sid = headers['SID']
+            self._listener.register(self)
+        self._async_schedule_renew(headers)
+        return self.sid is not None
+
+    async def async_resubscribe(self):
+        """Drop current subscription and subscribe again.
+
+        Used when the device is reachable again after failures, as it may
+        have been rebooted and forgotten the subscription.
+        """
+        if self._unsub_renew is not None:
+            self._unsub_renew()
+            self._unsub_renew = None
+        if self.sid is not None:
+            self._listener.unregister(self)
+            self.sid = None
+        return await self.async_subscribe()
+
+    async def _async_renew(self, now=None):
+        """Renew subscription. Resubscribe if device forgot about us."""
+        self._unsub_renew = None
+        if self.sid is None:
+            await self.async_subscribe()
+            return
+        headers = await self._async_request('SUBSCRIBE', {
+            'SID': self.sid,
+            'TIMEOUT': 'Second-{0}'.format(UPNP_EVENTS_TIMEOUT),
+        })
+        if headers is None:
+            # Device was rebooted or is unreachable now
+            await self.async_resubscribe()
+            return
+        self._event_received = False
+        self._async_schedule_renew(headers)
+
+    async def async_unsubscribe(self):
+        """Cancel the subscription."""
+        if self._unsub_renew is not None:
+            self._unsub_renew()
+            self._unsub_renew = None
+        if self.sid is not None:
+            self._listener.unregister(self)
+            await self._async_request('UNSUBSCRIBE', {'SID': self.sid})
+            self.sid = None
+
+    @callback
+    def async_handle_notify(self, body):
+        """Pass changes from NOTIFY body to the event callback."""
+        self._event_received = True
+        try:
+            for prop in ET.fromstring(body):
+                for var in prop:
+                    if var.tag.rpartition('}')[2] == 'LastChange' and \
+                            var.text:
+                        self._event_callback(parse_last_change(var.text))
+        except ET.ParseError as exc:
+            _LOGGER.debug("Unable to parse event from %s: %s",
+                          self._host, exc)
+
+
+class UpnpEventListener:
+    """Local HTTP server receiving UPnP GENA event notifications."""
+
+    def __init__(self, hass, port=0):
+        """Initialize the listener."""
+        self.hass = hass
+        self._port = port
+        self._runner = None
+        self._subscriptions = {}
+
+    @property
+    def session(self):
+        """Client session used for subscription requests."""
+        return async_get_clientsession(self.hass)
+
+    async def async_start(self):
+        """Start HTTP server."""
+        app = web.Application()
+        app.router.add_route('NOTIFY', UPNP_EVENTS_PATH, self._async_notify)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '0.0.0.0', self._port)
+        await site.start()
+        # pylint: disable=W0212
+        self._port = site._server.sockets[0].getsockname()[1]
+        _LOGGER.debug("UPnP event listener started on port %d", self._port)
+
+    async def async_stop(self):
+        """Cancel all subscriptions and stop HTTP server."""
+        for subscription in list(self._subscriptions.values()):
+            await subscription.async_unsubscribe()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def callback_url(self, host):
+        """Return callback URL reachable from the host."""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect((host, SSDP_PORT))
+            local_ip = sock.getsockname()[0]
+        return 'http://{0}:{1}{2}'.format(local_ip, self._port,
+                                          UPNP_EVENTS_PATH)
+
+    async def async_subscribe(self, service, host, event_callback):
+        """Subscribe to events of upnpclient service."""
+        # pylint: disable=W0212
+        url = urljoin(service._url_base, service._event_sub_url)
+        subscription = UpnpSubscription(self, host, url, event_callback)
+        await subscription.async_subscribe()
+        return subscription
+
+    @callback
+    def register(self, subscription):
+        """Route notifications with subscription SID."""
+        self._subscriptions[subscription.sid] = subscription
+
+    @callback
+    def unregister(self, subscription):
+        """Stop routing notifications with subscription SID."""
+        self._subscriptions.pop(subscription.sid, None)
+
+    async def _async_notify(self, request):
+        """Handle NOTIFY request."""
+        subscription = self._subscriptions.get(request.headers.get('SID'))
+        if subscription is None:
+            return web.Response(status=412)
+        subscription.async_handle_notify(await request.text())
+        return web.Response()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Replay recorded traffic of LinkPlay devices through the component offline.
+
+Record a live session by adding `record_traffic: linkplay.rec.gz` to the
+platform configuration, then run from the repository root with component
+requirements and Home Assistant installed:
+
+    python3 replay.py linkplay.rec.gz
+    python3 replay.py old_firmware.rec.gz new_firmware.rec.gz --loops 10
+    python3 replay.py linkplay.rec.gz --profile
+
+Every recorded device is updated once per recorded getPlayerStatus request,
+at full speed and without network. Recorded UPnP responses and ID3 tags are
+fed to the metadata pipeline. With --profile the whole replay is profiled.
+"""
+
+import argparse
+import asyncio
+import cProfile
+import json
+import logging
+import pstats
+import sys
+import time
+
+from benchmark import async_stop_hass, percentile
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_LOOPS = 1
+DEFAULT_TOP = 25
+
+
+def device_info(replay, host):
+    """Return (name, firmware, hardware) from recorded getStatus."""
+    from custom_components.linkplay.recording import SOURCE_HTTP, \
+        request_key
+
+    key = request_key('http://{0}/httpapi.asp?command=getStatus'.format(host))
+    for response in replay.responses(host, SOURCE_HTTP, key):
+        try:
+            status = json.loads(response)
+            return (status.get('DeviceName', host), status.get('firmware'),
+                    status.get('hardware'))
+        except ValueError:
+            continue
+    return host, None, None
+
+
+async def async_setup_devices(hass, replay):
+    """Set up component devices fed by the replay."""
+    from custom_components.linkplay import DATA_LASTFM, DATA_LINKPLAY, \
+        DATA_METADATA, DATA_METADATA_WORKERS, DATA_UPNP
+    from custom_components.linkplay.media_player import LinkPlayDevice
+    from custom_components.linkplay.metadata import LastFMCoverResolver, \
+        MetadataCache, MetadataWorkerPool
+    from custom_components.linkplay.recording import SOURCE_HTTP
+    from custom_components.linkplay.registry import DeviceRegistry
+    from custom_components.linkplay.upnp import UpnpDiscovery
+
+    hass.data[DATA_LINKPLAY] = registry = DeviceRegistry()
+    hass.data[DATA_UPNP] = discovery = UpnpDiscovery(hass)
+    hass.data[DATA_METADATA] = MetadataCache()
+    hass.data[DATA_LASTFM] = LastFMCoverResolver()
+    hass.data[DATA_METADATA_WORKERS] = MetadataWorkerPool(hass)
+
+    devices = []
+    for index, host in enumerate(replay.hosts):
+        lastfm = any(key.startswith('/2.0/')
+                     for key in replay.keys(host, SOURCE_HTTP))
+        # Replayed UPnP devices are named by host, so lookups by name
+        # never reach the network even if recorded hosts differ by port only
+        device = LinkPlayDevice(host, host, device_info(replay, host)[0],
+                                lfm_api_key='replay' if lastfm else None,
+                                traffic=replay)
+        device.hass = hass
+        device.entity_id = 'media_player.replay_{0:03d}'.format(index)
+        registry.async_register(device)
+        discovery.async_add_device(
+            'http://{0}/description.xml'.format(host),
+            replay.upnp_device(host))
+        devices.append(device)
+    return devices
+
+
+async def async_replay(replay):
+    """Replay the recording once, return update timings and errors."""
+    from homeassistant.core import HomeAssistant
+    from custom_components.linkplay.recording import SOURCE_HTTP, \
+        request_key
+
+    replay.rewind()
+    hass = HomeAssistant()
+    await hass.async_start()
+    devices = []
+    timings = {host: [] for host in replay.hosts}
+    errors = dict.fromkeys(replay.hosts, 0)
+    try:
+        devices = await async_setup_devices(hass, replay)
+        polls = {device.host: replay.count(
+            device.host, SOURCE_HTTP, request_key(
+                'http://{0}/httpapi.asp?command=getPlayerStatus'.format(
+                    device.host)))
+                 for device in devices}
+        for poll in range(max(polls.values(), default=0)):
+            for device in devices:
+                if poll >= polls[device.host]:
+                    continue
+                start = time.perf_counter()
+                try:
+                    await device.async_update()
+                except Exception:  # pylint: disable=W0703
+                    errors[device.host] += 1
+                    _LOGGER.exception("Update of %s failed", device.host)
+                timings[device.host].append(time.perf_counter() - start)
+            # Let metadata lookups of this round finish
+            await hass.async_block_till_done()
+        states = {device.host: (device.state, device.media_title,
+                                device.media_artist) for device in devices}
+    finally:
+        for device in devices:
+            await device.async_will_remove_from_hass()
+        await async_stop_hass(hass)
+    return timings, errors, states
+
+
+def replay_file(path, loops):
+    """Replay the recording loops times and print results per device."""
+    from custom_components.linkplay.recording import TrafficReplay
+
+    replay = TrafficReplay.load(path)
+    timings = {host: [] for host in replay.hosts}
+    errors = dict.fromkeys(replay.hosts, 0)
+    states = {}
+    for _ in range(loops):
+        loop_timings, loop_errors, states = asyncio.run(async_replay(replay))
+        for host in replay.hosts:
+            timings[host].extend(loop_timings[host])
+            errors[host] += loop_errors[host]
+
+    print(path)
+    for host in replay.hosts:
+        name, firmware, hardware = device_info(replay, host)
+        state, title, artist = states.get(host, (None, None, None))
+        print('  {0} ({1}, firmware {2}, hardware {3}): {4} updates, '
+              'p50 {5:.3f} ms, p95 {6:.3f} ms, {7} errors | {8}: {9} - '
+              '{10}'.format(
+                  host, name, firmware, hardware, len(timings[host]),
+                  percentile(timings[host], 50) * 1000,
+                  percentile(timings[host], 95) * 1000, errors[host],
+                  state, artist, title))
+
+
+def main():
+    """Replay recordings from command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('recordings', nargs='+',
+                        help='recorded traffic files')
+    parser.add_argument('--loops', type=int, default=DEFAULT_LOOPS,
+                        help='times to replay every recording')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile replay with cProfile')
+    parser.add_argument('--sort', default='cumulative',
+                        help='sort order of profile statistics')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP,
+                        help='functions to show in profile statistics')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    # Imports are done before profiling to keep them out of statistics
+    # pylint: disable=W0611
+    import eyed3.id3
+    from homeassistant.core import HomeAssistant
+    from custom_components.linkplay import media_player
+
+    profiler = cProfile.Profile() if args.profile else None
+    for path in args.recordings:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            replay_file(path, args.loops)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats(args.sort).print_stats(args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())